@@ -0,0 +1,366 @@
+from Lexer import Token
+from Parser import decl_token, block_token, assign_token, print_token, while_token, if_token, else_token
+from SyntaxTree import AST_NODE
+
+# Optimizer for the simplified AST, runs before the bytecode generation
+# The AST is lowered into a structured representation that has the meaning create_bytecode_seq gives to the tree:
+# - statements: ("assign", name, expr), ("print", expr), ("eval", expr) for expressions in the position of a statement,
+#   ("while", cond, body), ("if", cond, then, else_body or None), the bodies are lists of statements
+# - expressions: ("number", int), ("name", name), (binop, left, right)
+# - conditions: (comparison, left, right)
+# On this representation the passes propagate constants, remove branches and loops with a static condition, hoist
+# loop invariant expressions out of while loops and remove stores whose value is never read. The result is
+# raised back into an AST of the canonical shape that create_bytecode_seq translates as intended
+
+binop = {"plus", "minus", "div", "mul"}
+binop_functions = {"plus": lambda a, b: a + b, "minus": lambda a, b: a - b, "mul": lambda a, b: a * b,
+                   "div": lambda a, b: int(a / b)}
+cmp_functions = {"d_equal": lambda a, b: a == b, "greater_equal": lambda a, b: a >= b}
+symbols = {"plus": "+", "minus": "-", "mul": "*", "div": "/", "d_equal": "==", "greater_equal": ">="}
+
+max_const_bits = 64  # larger results are not folded, so the constants of the program stay small
+
+
+# Returns the declared names of the DECL top node
+def declared_names(ast_node):
+    names = set()
+    while ast_node is not None:
+        next_node = None
+        for child in ast_node.get_children():
+            if child.get_ttype() == "decl":
+                next_node = child
+            else:
+                names.add(child.get_value())
+        ast_node = next_node
+    return names
+
+
+# Raises the same error as the linker for undeclared variables, so that the optimizer can't remove the error
+def check_declared(name, declared):
+    if name not in declared:
+        raise NameError(f"Variable '{name}' is not declared")
+    return name
+
+
+def lower_expr(ast_node, declared):
+    ttype = ast_node.get_ttype()
+    if ttype == "number":
+        return "number", int(ast_node.get_value())
+    if ttype == "name":
+        return "name", check_declared(ast_node.get_value(), declared)
+    left = lower_expr(ast_node.get_child(1), declared)
+    return ttype, left, lower_expr(ast_node.get_child(0), declared)
+
+
+def lower_cond(ast_node, declared):
+    left = lower_expr(ast_node.get_child(1), declared)
+    return ast_node.get_ttype(), left, lower_expr(ast_node.get_child(0), declared)
+
+
+# Lowers the STMT top node, follows the work list of create_bytecode_seq
+# The work list contains pairs (node, list to which the statements of the node are added)
+def lower_stmts(ast_node, declared):
+    stmts = []
+    work = [(ast_node, stmts)]
+    while work:
+        (ast_node, target) = work.pop()
+        if ast_node is None:
+            continue
+        ttype = ast_node.get_ttype()
+        if ttype == "assign":
+            expr = lower_expr(ast_node.get_child(0), declared)
+            target.append(("assign", check_declared(ast_node.get_child(1).get_value(), declared), expr))
+        elif ttype in binop or ttype == "number" or ttype == "name":
+            target.append(("eval", lower_expr(ast_node, declared)))
+        elif ttype == "print":
+            target.append(("print", lower_expr(ast_node.get_child(0), declared)))
+        elif ttype == "while":
+            body = []
+            target.append(("while", lower_cond(ast_node.get_child(1), declared), body))
+            if ast_node.get_child(0).get_ttype() == "block" and len(ast_node.get_child(0).get_children()) > 1:
+                work.append((ast_node.get_child(0).get_child(0), target))  # block after the while
+                work.append((ast_node.get_child(0).get_child(1), body))
+            else:
+                work.append((ast_node.get_child(0), body))
+        elif ttype == "if":
+            child_len = len(ast_node.get_children())
+            cond = lower_cond(ast_node.get_child(child_len - 1), declared)
+            then = []
+            if ast_node.get_child(0).get_ttype() == "else":
+                else_node = ast_node.get_child(0)
+                else_body = []
+                target.append(("if", cond, then, else_body))
+                if len(else_node.get_children()) == 2:  # the block after the else block is part of the else branch
+                    work.append((else_node.get_child(0), else_body))
+                if else_node.get_children():
+                    work.append((else_node.get_child(len(else_node.get_children()) - 1), else_body))
+            else:
+                target.append(("if", cond, then, None))
+                if child_len == 3:  # there is a block after the if statement
+                    work.append((ast_node.get_child(0), target))
+            if child_len > 1:  # an if block without statements only has the predicate
+                work.append((ast_node.get_child(child_len - 2), then))
+        else:
+            work.extend((child, target) for child in ast_node.get_children())
+    return stmts
+
+
+# Returns the names that are assigned in stmts, including nested statements
+def assigned_names(stmts, names=None):
+    if names is None:
+        names = set()
+    for stmt in stmts:
+        if stmt[0] == "assign":
+            names.add(stmt[1])
+        elif stmt[0] == "while":
+            assigned_names(stmt[2], names)
+        elif stmt[0] == "if":
+            assigned_names(stmt[2], names)
+            assigned_names(stmt[3] or [], names)
+    return names
+
+
+def expr_names(expr, names):
+    if expr[0] == "name":
+        names.add(expr[1])
+    elif expr[0] != "number":
+        expr_names(expr[1], names)
+        expr_names(expr[2], names)
+    return names
+
+
+# Returns the names that are read in stmts, including nested statements
+def read_names(stmts, names=None):
+    if names is None:
+        names = set()
+    for stmt in stmts:
+        if stmt[0] == "while":
+            expr_names(stmt[1], names)
+            read_names(stmt[2], names)
+        elif stmt[0] == "if":
+            expr_names(stmt[1], names)
+            read_names(stmt[2], names)
+            read_names(stmt[3] or [], names)
+        else:
+            expr_names(stmt[-1], names)
+    return names
+
+
+# An expression can only fail with a division (by zero or with a result that is too large for a float)
+def may_raise(expr):
+    if expr[0] == "div":
+        return True
+    if expr[0] == "number" or expr[0] == "name":
+        return False
+    return may_raise(expr[1]) or may_raise(expr[2])
+
+
+# Returns the expression with the known constants of env inserted and constant operations folded
+def fold_expr(expr, env):
+    if expr[0] == "name":
+        return ("number", env[expr[1]]) if expr[1] in env else expr
+    if expr[0] == "number":
+        return expr
+    left = fold_expr(expr[1], env)
+    right = fold_expr(expr[2], env)
+    if left[0] == "number" and right[0] == "number":
+        try:
+            value = binop_functions[expr[0]](left[1], right[1])
+        except (ZeroDivisionError, OverflowError):  # the error is raised when the program is executed
+            value = None
+        if value is not None and value.bit_length() <= max_const_bits:
+            return "number", value
+    return expr[0], left, right
+
+
+# Returns True or False if the folded condition is static, otherwise None
+def static_cond(cond):
+    if cond[1][0] == "number" and cond[2][0] == "number":
+        return cmp_functions[cond[0]](cond[1][1], cond[2][1])
+    return None
+
+
+# Constant propagation, env maps the names with a known value to the value and is updated to the state after stmts
+# The variables start with unknown values, if statements and while loops with a static condition are replaced by the
+# statements that are executed
+def propagate_constants(stmts, env):
+    result = []
+    for stmt in stmts:
+        if stmt[0] == "assign":
+            expr = fold_expr(stmt[2], env)
+            if expr[0] == "number":
+                env[stmt[1]] = expr[1]
+            else:
+                env.pop(stmt[1], None)
+            result.append(("assign", stmt[1], expr))
+        elif stmt[0] == "print" or stmt[0] == "eval":
+            result.append((stmt[0], fold_expr(stmt[1], env)))
+        elif stmt[0] == "while":
+            for name in assigned_names(stmt[2]):  # the values of these names change between the iterations
+                env.pop(name, None)
+            cond = (stmt[1][0], fold_expr(stmt[1][1], env), fold_expr(stmt[1][2], env))
+            if static_cond(cond) is False:
+                continue
+            result.append(("while", cond, propagate_constants(stmt[2], dict(env))))
+        else:
+            cond = (stmt[1][0], fold_expr(stmt[1][1], env), fold_expr(stmt[1][2], env))
+            decided = static_cond(cond)
+            if decided is True:
+                result.extend(propagate_constants(stmt[2], env))
+                continue
+            if decided is False:
+                result.extend(propagate_constants(stmt[3] or [], env))
+                continue
+            then_env = dict(env)
+            then = propagate_constants(stmt[2], then_env)
+            else_env = dict(env)
+            else_body = propagate_constants(stmt[3], else_env) if stmt[3] is not None else None
+            env.clear()
+            env.update({name: value for (name, value) in then_env.items()
+                        if name in else_env and else_env[name] == value})
+            result.append(("if", cond, then, else_body))
+    return result
+
+
+# Replaces the loop invariant expressions of expr with temporary variables
+# invariants maps the expressions to their temporary variable, temps is the list of all temporary variables
+def replace_invariants(expr, killed, invariants, temps):
+    if expr[0] == "number" or expr[0] == "name":
+        return expr
+    if not may_raise(expr) and not (expr_names(expr, set()) & killed):
+        if expr not in invariants:
+            invariants[expr] = f"_t{len(temps)}"  # can't collide with the names of the program
+            temps.append(invariants[expr])
+        return "name", invariants[expr]
+    return expr[0], replace_invariants(expr[1], killed, invariants, temps), \
+        replace_invariants(expr[2], killed, invariants, temps)
+
+
+# Hoists the loop invariant expressions of the while loops into temporary variables that are assigned before the loop
+# Expressions that may raise an error are not hoisted, as the loop might not execute them
+def hoist_invariants(stmts, temps):
+    result = []
+    for stmt in stmts:
+        if stmt[0] == "while":
+            body = hoist_invariants(stmt[2], temps)
+            killed = assigned_names(body)
+            invariants = {}
+            cond = (stmt[1][0], replace_invariants(stmt[1][1], killed, invariants, temps),
+                    replace_invariants(stmt[1][2], killed, invariants, temps))
+            body = [replace_stmt_invariants(s, killed, invariants, temps) for s in body]
+            result.extend(("assign", name, expr) for (expr, name) in invariants.items())
+            result.append(("while", cond, body))
+        elif stmt[0] == "if":
+            else_body = hoist_invariants(stmt[3], temps) if stmt[3] is not None else None
+            result.append(("if", stmt[1], hoist_invariants(stmt[2], temps), else_body))
+        else:
+            result.append(stmt)
+    return result
+
+
+# Replaces the invariants in the expressions of stmt, nested loops have already been hoisted
+def replace_stmt_invariants(stmt, killed, invariants, temps):
+    if stmt[0] == "while":
+        return stmt
+    if stmt[0] == "if":
+        cond = (stmt[1][0], replace_invariants(stmt[1][1], killed, invariants, temps),
+                replace_invariants(stmt[1][2], killed, invariants, temps))
+        then = [replace_stmt_invariants(s, killed, invariants, temps) for s in stmt[2]]
+        else_body = [replace_stmt_invariants(s, killed, invariants, temps) for s in stmt[3]] \
+            if stmt[3] is not None else None
+        return "if", cond, then, else_body
+    return stmt[:-1] + (replace_invariants(stmt[-1], killed, invariants, temps),)
+
+
+# Removes the stores whose value is never read and the expressions whose value is not used, backwards over stmts
+# live is the set of names that may be read after stmts, returns the statements and the names that may be read before
+# them. Inside a while loop every name that is read in the loop counts as read after every statement of the body, so a
+# store in a loop is only removed if its variable isn't read in the loop or after it
+# The expressions that may raise an error are kept, a store of such an expression stays a store, as the bytecode has
+# no instruction that drops the value of an expression from the stack
+def remove_dead_stores(stmts, live):
+    result = []
+    live = set(live)
+    for stmt in reversed(stmts):
+        if stmt[0] == "assign":
+            if stmt[1] in live or may_raise(stmt[2]):
+                result.append(stmt)
+                live.discard(stmt[1])
+                expr_names(stmt[2], live)
+        elif stmt[0] == "eval":
+            if may_raise(stmt[1]):
+                result.append(stmt)
+                expr_names(stmt[1], live)
+        elif stmt[0] == "print":
+            result.append(stmt)
+            expr_names(stmt[1], live)
+        elif stmt[0] == "while":
+            live = read_names([stmt], live)  # the names that may be read after the loop or in a later iteration
+            (body, _) = remove_dead_stores(stmt[2], live)
+            result.append(("while", stmt[1], body))
+        else:
+            (then, then_live) = remove_dead_stores(stmt[2], live)
+            (else_body, else_live) = remove_dead_stores(stmt[3], live) if stmt[3] is not None else (None, live)
+            if then or else_body or may_raise(stmt[1][1]) or may_raise(stmt[1][2]):
+                result.append(("if", stmt[1], then, else_body))
+            live = then_live | else_live
+            expr_names(stmt[1][1], live)
+            expr_names(stmt[1][2], live)
+    result.reverse()
+    return result, live
+
+
+def leaf(ttype, value):
+    return AST_NODE(Token(ttype, str(value)))
+
+
+def raise_expr(expr):
+    if expr[0] == "number" or expr[0] == "name":
+        return leaf(expr[0], expr[1])
+    return AST_NODE(Token(expr[0], symbols[expr[0]]), [raise_expr(expr[2]), raise_expr(expr[1])])
+
+
+# Returns the block node of stmts, create_bytecode_seq translates the children of a block from the last to the first
+def raise_stmts(stmts):
+    children = []
+    for stmt in reversed(stmts):
+        if stmt[0] == "assign":
+            children.append(AST_NODE(assign_token, [raise_expr(stmt[2]), leaf("name", stmt[1])]))
+        elif stmt[0] == "print":
+            children.append(AST_NODE(print_token, [raise_expr(stmt[1])]))
+        elif stmt[0] == "eval":
+            children.append(raise_expr(stmt[1]))
+        elif stmt[0] == "while":
+            # the body is wrapped in a block with one child, so it is not taken for a body and the block after it
+            children.append(AST_NODE(while_token, [AST_NODE(block_token, [raise_stmts(stmt[2])]), raise_expr(stmt[1])]))
+        elif stmt[3] is None:
+            children.append(AST_NODE(if_token, [raise_stmts(stmt[2]), raise_expr(stmt[1])]))
+        else:
+            else_node = AST_NODE(else_token, [raise_stmts(stmt[3])])
+            children.append(AST_NODE(if_token, [else_node, raise_stmts(stmt[2]), raise_expr(stmt[1])]))
+    return AST_NODE(block_token, children)
+
+
+# Returns the optimized AST of the program
+# Programs that are nested too deeply for the recursive passes are returned unchanged
+# The declared variables can be run with any initial values and their final values are part of the result, so their
+# values are unknown at the start and they are read after the program
+def optimize_ast(ast_root):
+    decl_node = ast_root.get_child(1)
+    declared = declared_names(decl_node)
+    stmts = lower_stmts(ast_root.get_child(0), declared)
+    try:
+        stmts = propagate_constants(stmts, {})
+        temps = []
+        stmts = hoist_invariants(stmts, temps)
+        while True:
+            (optimized, _) = remove_dead_stores(stmts, declared)
+            if optimized == stmts:
+                break
+            stmts = optimized
+        stmt_node = raise_stmts(stmts)
+    except RecursionError:
+        return ast_root
+    for name in temps:
+        decl_node = AST_NODE(decl_token, [decl_node, leaf("name", name)])
+    return AST_NODE(block_token, [stmt_node, decl_node])
@@ -0,0 +1,124 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Parser import get_parsing_table
+from ProgramCache import get_program
+from Engines import engines
+from Output import MEMORY_OUTPUT
+from Optimizer import get_optimized_code
+from Profiler import run_profiled
+from Profiler import profile_report
+
+# Batch mode: compiles and executes many programs in parallel on a process pool
+# Every worker builds (or loads) the parsing table once when it starts, the compiled programs are cached on disk (see
+# ProgramCache.py), so a batch that is run again skips the front end for all unchanged programs
+
+
+# Returns the program files of the arguments: files, directories (all .txt files in it) and glob patterns
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, "*.txt"))))
+        elif glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern)))
+        else:
+            paths.append(pattern)
+    unique = {}
+    for path in paths:
+        unique.setdefault(os.path.abspath(path), path)  # every program only once, also if it is given by other paths
+    return list(unique.values())
+
+
+# Compiles and executes the program file, runs in a worker process
+# Returns the result: the path, the status ("ok" or the name of the error), the error message, the output and the time
+# With profile the program is executed by the profiler instead of the engine (on the optimized code for the optimized
+# engine, otherwise on the linked code) and the result also contains the report of the profile
+def run_file(path, engine_name, optimized, profile=False):
+    start = time.perf_counter()
+    output = MEMORY_OUTPUT()
+    status = "ok"
+    error = ""
+    report = None
+    try:
+        with open(path, "r") as file:
+            program_str = file.read()
+        program = get_program(path, program_str, optimized)
+        if profile:
+            code = get_optimized_code(program) if engine_name == "optimized" else program.get_code()
+            (program_profile, _) = run_profiled(program, code=code, output=output)
+            report = profile_report(program_profile, program.get_var_names())
+        else:
+            engines[engine_name](program, output=output)
+    except Exception as e:
+        status = type(e).__name__
+        error = str(e)
+    result = {"path": path, "status": status, "error": error, "output": output.get_value(),
+              "seconds": time.perf_counter() - start}
+    if report is not None:
+        result["profile"] = report
+    return result
+
+
+def print_summary(results, seconds):
+    for result in results:
+        line = f"{result['status']:<20} {result['seconds']:8.3f}s  {result['path']}"
+        if result["error"]:
+            line += f": {result['error']}"
+        print(line)
+    failed = sum(1 for result in results if result["status"] != "ok")
+    print(f"{len(results)} programs, {len(results) - failed} ok, {failed} failed, {seconds:.3f}s")
+
+
+# Returns the path in output_dir of every program without the extension of the output: the path of the program relative
+# to the directory that contains all programs, so programs with the same name in different directories don't overwrite
+# each other's output. Raises a ValueError if two programs would still have the same output
+def output_paths(paths, output_dir):
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    names = [os.path.join(output_dir, os.path.relpath(os.path.abspath(path), root)) for path in paths]
+    seen = {}
+    for (path, name) in zip(paths, names):
+        other = seen.setdefault(os.path.normcase(name), path)
+        if other != path:
+            raise ValueError(f"The programs '{other}' and '{path}' have the same output file '{name}'")
+    return names
+
+
+# Writes the output of every program into <name>.out and the profiles into <name>.prof, names are the output paths of
+# the programs (see output_paths)
+def write_outputs(results, names):
+    for (result, name) in zip(results, names):
+        os.makedirs(os.path.dirname(name) or ".", exist_ok=True)
+        with open(name + ".out", "w") as file:
+            file.write(result["output"])
+        if "profile" in result:
+            with open(name + ".prof", "w") as file:
+                file.write(result["profile"] + "\n")
+
+
+# Runs the programs of patterns with jobs worker processes and prints the summary, returns the exit code:
+# 0 if all programs were executed without an error, otherwise 1. Raises a ValueError before any program is run if two
+# programs have the same output file
+# summary_path: file for the results as json, output_dir: directory for the outputs of the programs
+# profile: profile the programs, the reports are part of the results and written into output_dir
+def run_batch(patterns, jobs=None, engine_name="stack", optimized=False, summary_path=None, output_dir=None,
+              profile=False):
+    start = time.perf_counter()
+    paths = expand_paths(patterns)
+    n = len(paths)
+    names = output_paths(paths, output_dir) if output_dir is not None else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=get_parsing_table) as pool:
+        results = list(pool.map(run_file, paths, [engine_name] * n, [optimized] * n, [profile] * n,
+                                chunksize=max(1, n // (4 * (jobs or os.cpu_count() or 1)))))
+    print_summary(results, time.perf_counter() - start)
+    if summary_path is not None:
+        with open(summary_path, "w") as file:
+            json.dump(results, file, indent=2)
+    if names is not None:
+        write_outputs(results, names)
+    return 0 if all(result["status"] == "ok" for result in results) else 1
@@ -0,0 +1,212 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+from Lexer import tokenize_program_str
+from Parser import cfg, r0, create_pda, create_parsing_table, Parse_Table, get_parsing_table, parse_word, simplify_ast
+from Parser import token_str_to_ast
+from Interpreter import PROGRAM
+from Engines import engines
+from Output import OUTPUT
+from Profiler import run_profiled
+
+# Benchmark suite for the phases of the interpreter
+# The programs are generated with a controlled shape and size, every phase is timed on its own (the best of several
+# runs) and reported as throughput: tokens per second for the front end, instructions per second for the bytecode
+# generation and executed instructions per second for the execution
+# The results can be saved as baseline and compared with a later run, a phase that got slower than the threshold is a
+# regression
+
+# Shapes of the generated programs, the size is the number of statements, the nesting depth, the loop iterations or
+# the number of declared variables
+default_sizes = {"flat": 2000, "nested": 200, "loop": 20000, "wide": 2000}
+
+
+# Returns a name for every index, names are letters only and start with v, so they are never keywords
+def var_name(i):
+    name = ""
+    while True:
+        name = chr(ord("a") + i % 26) + name
+        i = i // 26 - 1
+        if i < 0:
+            return "v" + name
+
+
+# A long list of statements without control flow
+def flat_program(size):
+    stmts = ["a = 1;"]
+    for i in range(size):
+        stmts.append(["a = a + 1;", "b = (a * 2) - b;", "c = (b + a) / 3;", "print(c);"][i % 4])
+    return "a, b, c;\n" + "\n".join(stmts) + "\n"
+
+
+# if/else statements nested size deep in the then blocks
+def nested_program(size):
+    lines = ["a, b;", "a = 1;"]
+    for depth in range(size):
+        lines.append("  " * depth + f"if (a >= {depth}) {{")
+        lines.append("  " * depth + "  a = a + 1;")
+    lines.append("  " * size + "print(a);")
+    for depth in reversed(range(size)):
+        lines.append("  " * depth + "} else {")
+        lines.append("  " * depth + "  b = b + 1;")
+        lines.append("  " * depth + "}")
+    lines.append("print(b);")
+    return "\n".join(lines) + "\n"
+
+
+# A tight while loop with size iterations
+def loop_program(size):
+    return f"x, i, y, n;\n" \
+           f"n = {size};\n" \
+           f"while (n >= i) {{\n" \
+           f"  x = x + (i * 2);\n" \
+           f"  y = x - 3;\n" \
+           f"  i = i + 1;\n" \
+           f"}}\n" \
+           f"print(x);\n"
+
+
+# size declared variables, every variable is assigned once
+def wide_program(size):
+    names = [var_name(i) for i in range(size)]
+    stmts = [f"{names[0]} = 1;"]
+    for i in range(1, size):
+        stmts.append(f"{names[i]} = {names[i - 1]} + {i % 7};")
+    stmts.append(f"print({names[-1]});")
+    return ", ".join(names) + ";\n" + "\n".join(stmts) + "\n"
+
+
+generators = {"flat": flat_program, "nested": nested_program, "loop": loop_program, "wide": wide_program}
+
+
+# Returns the program of the shape with the size
+def generate_program(shape, size):
+    return generators[shape](size)
+
+
+# Returns the best time of repeat calls of run, setup is called before every call and its result passed to run
+def best_time(run, setup=lambda: None, repeat=5):
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+# Returns the results of the grammar phases: create_pda and create_parsing_table, they don't depend on the program
+def benchmark_grammar(repeat=5):
+    pda = create_pda(cfg, r0)
+    return {"create_pda": {"seconds": best_time(lambda _: create_pda(cfg, r0), repeat=repeat),
+                           "units": len(pda.Q), "unit": "states"},
+            "create_parsing_table": {"seconds": best_time(lambda _: Parse_Table(create_parsing_table(pda), cfg),
+                                                          repeat=repeat),
+                                     "units": len(pda.Q), "unit": "states"}}
+
+
+# Returns the results of the phases for the program: phase -> {seconds, units, unit}
+# simplify_ast is recursive, its result is None for programs that are nested too deeply for it
+def benchmark_program(program_str, repeat=5, engine_name="stack"):
+    table = get_parsing_table()
+    tokens = tokenize_program_str(program_str)
+    results = {"tokenize": {"seconds": best_time(lambda _: tokenize_program_str(program_str), repeat=repeat),
+                            "units": len(tokens), "unit": "tokens"},
+               "parse_word": {"seconds": best_time(lambda _: parse_word(table, tokens, cfg), repeat=repeat),
+                              "units": len(tokens), "unit": "tokens"}}
+    try:
+        seconds = best_time(simplify_ast, lambda: parse_word(table, tokens, cfg, semantic=False), repeat)
+        results["simplify_ast"] = {"seconds": seconds, "units": len(tokens), "unit": "tokens"}
+    except RecursionError:
+        results["simplify_ast"] = None
+    ast = token_str_to_ast(tokens)
+    program = PROGRAM(ast)
+    results["create_bytecode_seq"] = {"seconds": best_time(lambda _: PROGRAM(ast), repeat=repeat),
+                                      "units": len(program.get_code()), "unit": "instructions"}
+    output = OUTPUT(lambda text: None)
+    (profile, _) = run_profiled(program, output=output)  # only to count the executed instructions
+    results["execute"] = {"seconds": best_time(lambda _: engines[engine_name](program, output=output),
+                                               repeat=repeat),
+                          "units": sum(profile.counts), "unit": "executed instructions"}
+    return results
+
+
+# Runs the benchmarks of the shapes (shape -> size), returns the results: group -> phase -> result
+def run_benchmarks(sizes, repeat=5, engine_name="stack"):
+    results = {"grammar": benchmark_grammar(repeat)}
+    for (shape, size) in sizes.items():
+        results[f"{shape}-{size}"] = benchmark_program(generate_program(shape, size), repeat, engine_name)
+    return results
+
+
+# Returns the regressions of results against baseline: (group, phase, ratio) for the phases that take more than
+# 1 + threshold times the time of the baseline, and prints the comparison
+def compare_results(results, baseline, threshold=0.1):
+    regressions = []
+    print(f"{'benchmark':<36}{'baseline':>12}{'now':>12}{'ratio':>8}")
+    for (group, phases) in results.items():
+        for (phase, result) in phases.items():
+            old = baseline.get(group, {}).get(phase)
+            if result is None or old is None:
+                continue
+            ratio = result["seconds"] / old["seconds"] if old["seconds"] > 0 else 1
+            line = f"{group + ' ' + phase:<36}{old['seconds'] * 1e3:>10.3f}ms{result['seconds'] * 1e3:>10.3f}ms" \
+                   f"{ratio:>8.2f}"
+            if ratio > 1 + threshold:
+                regressions.append((group, phase, ratio))
+                line += "  REGRESSION"
+            print(line)
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<36}{'time':>12}{'throughput':>16}  unit")
+    for (group, phases) in results.items():
+        for (phase, result) in phases.items():
+            if result is None:
+                print(f"{group + ' ' + phase:<36}{'-':>12}{'-':>16}  (nested too deeply)")
+                continue
+            throughput = result["units"] / result["seconds"] if result["seconds"] > 0 else 0
+            print(f"{group + ' ' + phase:<36}{result['seconds'] * 1e3:>10.3f}ms{throughput:>16,.0f}  "
+                  f"{result['unit']}/s")
+
+
+arg_parser = argparse.ArgumentParser(description="Benchmarks the phases of the interpreter on generated programs")
+arg_parser.add_argument("--shape", action="append", choices=list(generators),
+                        help="shape of the generated programs (default: all), can be given several times")
+arg_parser.add_argument("--scale", type=float, default=1.0, help="factor for the default sizes of the programs")
+arg_parser.add_argument("--repeat", type=int, default=5, help="runs per phase, the best time is reported")
+arg_parser.add_argument("--engine", choices=list(engines), default="stack", help="engine for the execute phase")
+arg_parser.add_argument("--save", help="save the results as baseline to this file")
+arg_parser.add_argument("--baseline", help="compare the results with the baseline in this file")
+arg_parser.add_argument("--threshold", type=float, default=0.1,
+                        help="a phase is a regression if it is this much slower than the baseline (default: 0.1)")
+arg_parser.add_argument("--write-program", nargs=2, metavar=("SHAPE", "SIZE"),
+                        help="only print a generated program, e.g. for batch mode")
+
+
+if __name__ == '__main__':
+    args = arg_parser.parse_args()
+    if args.write_program:
+        print(generate_program(args.write_program[0], int(args.write_program[1])), end="")
+        sys.exit(0)
+    shapes = args.shape or list(generators)
+    sizes = {shape: max(1, int(default_sizes[shape] * args.scale)) for shape in shapes}
+    results = run_benchmarks(sizes, args.repeat, args.engine)
+    print_results(results)
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        print()
+        if compare_results(results, baseline["results"], args.threshold):
+            exit_code = 1
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"python": platform.python_version(), "engine": args.engine, "results": results}, file,
+                      indent=2)
+    sys.exit(exit_code)
@@ -0,0 +1,213 @@
+from functools import partial
+
+from Interpreter import *
+from Output import OUTPUT
+
+# Closure threaded execution engine for the linked bytecode
+# The code is split into basic blocks and every block is translated once into a closure that executes the whole block
+# and returns the index of the next block. Inside a block the operand stack is resolved at translation time:
+# every expression becomes a closure that computes its value directly from the variable list, so at runtime there is
+# no dispatch per instruction and no operand stack, only one call per block, statement and inner expression node
+
+# Kinds of the items on the operand stack during the translation
+VAR = 0  # the value of a variable, payload is the slot
+CONST = 1  # a constant, payload is the value
+EXPR = 2  # a computed value, payload is a closure
+STACK = 3  # a value that has already been pushed on the runtime stack
+
+
+def idiv(a, b):
+    return int(a / b)
+
+
+binop_functions = {IADD: lambda a, b: a + b, ISUB: lambda a, b: a - b, IMUL: lambda a, b: a * b, IDIV: idiv}
+
+# Closures for the most common binary operations with variable and constant operands, the operator is inlined
+# Key: (opcode, kind of the left operand, kind of the right operand), the factory gets the variables and both payloads
+specialized_binops = {
+    (IADD, VAR, CONST): lambda v, x, y: lambda: v[x] + y,
+    (IADD, VAR, VAR): lambda v, x, y: lambda: v[x] + v[y],
+    (IADD, EXPR, CONST): lambda v, x, y: lambda: x() + y,
+    (IADD, EXPR, VAR): lambda v, x, y: lambda: x() + v[y],
+    (IADD, VAR, EXPR): lambda v, x, y: lambda: v[x] + y(),
+    (IADD, EXPR, EXPR): lambda v, x, y: lambda: x() + y(),
+    (ISUB, VAR, CONST): lambda v, x, y: lambda: v[x] - y,
+    (ISUB, VAR, VAR): lambda v, x, y: lambda: v[x] - v[y],
+    (ISUB, EXPR, CONST): lambda v, x, y: lambda: x() - y,
+    (ISUB, EXPR, VAR): lambda v, x, y: lambda: x() - v[y],
+    (ISUB, VAR, EXPR): lambda v, x, y: lambda: v[x] - y(),
+    (ISUB, EXPR, EXPR): lambda v, x, y: lambda: x() - y(),
+    (IMUL, VAR, CONST): lambda v, x, y: lambda: v[x] * y,
+    (IMUL, VAR, VAR): lambda v, x, y: lambda: v[x] * v[y],
+    (IMUL, EXPR, CONST): lambda v, x, y: lambda: x() * y,
+    (IMUL, EXPR, VAR): lambda v, x, y: lambda: x() * v[y],
+    (IMUL, VAR, EXPR): lambda v, x, y: lambda: v[x] * y(),
+    (IMUL, EXPR, EXPR): lambda v, x, y: lambda: x() * y(),
+}
+
+
+# Returns a closure that computes the value of the stack item (kind, payload)
+def item_closure(item, variables):
+    (kind, payload) = item
+    if kind == VAR:
+        return lambda: variables[payload]
+    if kind == CONST:
+        return lambda: payload
+    return payload
+
+
+# Returns the stack item for the binary operation op with the operands left and right
+def binop_item(op, left, right, variables):
+    factory = specialized_binops.get((op, left[0], right[0]))
+    if factory is not None:
+        return EXPR, factory(variables, left[1], right[1])
+    f = binop_functions[op]
+    left_f = item_closure(left, variables)
+    right_f = item_closure(right, variables)
+    return EXPR, lambda: f(left_f(), right_f())
+
+
+# Returns a closure for istore of the stack item into slot
+def store_closure(slot, item, variables):
+    (kind, payload) = item
+    if kind == VAR:
+        def store():
+            variables[slot] = variables[payload]
+    elif kind == CONST:
+        def store():
+            variables[slot] = payload
+    else:
+        def store():
+            variables[slot] = payload()
+    return store
+
+
+# Returns the addresses at which a basic block starts
+def find_block_starts(code):
+    starts = {0}
+    for (pc, instr) in enumerate(code):
+        if instr[0] in jump_ops:
+            starts.add(instr[1])
+            starts.add(pc + 1)
+    return sorted(start for start in starts if start < len(code))
+
+
+# Evaluates all items that are not on the runtime stack yet and pushes them, is used before a statement, so that
+# values that stay on the stack are computed in the order of the bytecode
+def flush_items(items, statements, variables, stack):
+    for (i, item) in enumerate(items):
+        if item[0] != STACK:
+            statements.append(partial(push_closure, stack, item_closure(item, variables)))
+            items[i] = (STACK, None)
+
+
+# Pops the operands of the instruction at pc from the translation stack
+def pop_items(items, count, pc):
+    if len(items) < count or any(kind == STACK for (kind, payload) in items[-count:]):
+        raise ValueError(f"Operands of the instruction at address {pc} are not computed in the same block")
+    operands = items[-count:]
+    del items[-count:]
+    return operands
+
+
+# Translates the block code[start:end] into a closure that returns the index of the next block (-1 to stop)
+# block_index maps the addresses of the blocks to their index, output is the sink of the print instruction
+# Values that stay on the operand stack (the code generator leaves such values for bodies without braces) are pushed
+# on stack, an instruction that pops values of a previous block or from stack is rejected with a ValueError
+def translate_block(code, start, end, block_index, variables, stack, output):
+    items = []
+    statements = []
+    next_block = block_index.get(end, -1)
+    jump = None
+    for pc in range(start, end):
+        instr = code[pc]
+        op = instr[0]
+        if op == ILOAD:
+            items.append((VAR, instr[1]))
+        elif op == ICONST:
+            items.append((CONST, instr[1]))
+        elif op == GOTO:
+            next_block = block_index.get(instr[1], -1)
+        elif op == ICMPE or op == ICMPGE:
+            (left, right) = pop_items(items, 2, pc)
+            flush_items(items, statements, variables, stack)
+            jump = (op, item_closure(left, variables), item_closure(right, variables), block_index.get(instr[1], -1))
+        elif op == ISTORE:
+            (value,) = pop_items(items, 1, pc)
+            flush_items(items, statements, variables, stack)
+            statements.append(store_closure(instr[1], value, variables))
+        elif op == PRINT:
+            (value,) = pop_items(items, 1, pc)
+            flush_items(items, statements, variables, stack)
+            statements.append(partial(print_closure, output, item_closure(value, variables)))
+        else:
+            (left, right) = pop_items(items, 2, pc)
+            items.append(binop_item(op, left, right, variables))
+    flush_items(items, statements, variables, stack)
+
+    statements = tuple(statements)
+    if jump is None:
+        def block():
+            for statement in statements:
+                statement()
+            return next_block
+    elif jump[0] == ICMPGE:  # jump if right > left
+        (op, left, right, target) = jump
+
+        def block():
+            for statement in statements:
+                statement()
+            return target if left() < right() else next_block
+    else:  # jump if right != left
+        (op, left, right, target) = jump
+
+        def block():
+            for statement in statements:
+                statement()
+            return target if left() != right() else next_block
+    return block
+
+
+def print_closure(output, value):
+    output.print(value())
+
+
+def push_closure(stack, value):
+    stack.append(value())
+
+
+# Translates the linked code into a list of block closures that work on variables, block 0 is the entry
+def translate_code(code, variables, output):
+    stack = []  # only used for the values left on the stack by a block
+    starts = find_block_starts(code)
+    block_index = {start: i for (i, start) in enumerate(starts)}
+    blocks = []
+    for (i, start) in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(code)
+        blocks.append(translate_block(code, start, end, block_index, variables, stack, output))
+    return blocks
+
+
+# Executes the block closures until a block returns -1
+def run_blocks(blocks):
+    block = 0 if blocks else -1
+    while block >= 0:
+        block = blocks[block]()
+
+
+# Executes the program with the closure threaded engine and returns the values of the variables at the end
+# The closures are bound to the variable list of the run, so the program is translated for every run
+# Code that can't be translated into blocks (see translate_block) is executed by the stack VM instead
+def run_threaded(program, values=None, output=None):
+    if output is None:
+        output = OUTPUT()
+    variables = program.initial_variables(values)
+    try:
+        blocks = translate_code(program.get_code(), variables, output)
+    except ValueError:
+        return program.run(values, output=output)
+    try:
+        run_blocks(blocks)
+    finally:
+        output.flush()
+    return program.variable_values(variables)
@@ -0,0 +1,13 @@
+from Interpreter import run_stack
+from ClosureVM import run_threaded
+from PyCompiler import run_native
+from Optimizer import run_optimized
+from Jit import run_jit
+
+# The engines that can execute a program, every engine takes the program, the initial values of the variables and the
+# output sink (see Output.py) and returns the values of the variables at the end
+engines = {"stack": run_stack,
+           "optimized": run_optimized,
+           "threaded": run_threaded,
+           "native": run_native,
+           "jit": run_jit}
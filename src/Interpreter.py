@@ -1,210 +1,689 @@
-from Parser import Stack
+from bisect import bisect_left
+from functools import partial
+
+from Output import OUTPUT
+from SyntaxTree import AST_NODE
 binop = {"plus", "minus", "div", "mul"}
 binop_map = {"plus": "iadd", "minus": "isub", "div": "idiv", "mul": "imul"}
 
 cmp = {"d_equal", "greater_equal"}
 cmp_map = {"d_equal": "icmpe", "greater_equal": "icmpge"}
-
-
-class INTERPRETER:
-    def __init__(self, ast_root):
+statements = {"assign", "print", "while", "if"}  # the nodes that start a new entry of the line table
+
+# Opcodes of the linked bytecode, an instruction is a tuple (opcode, operands...)
+# - iconst: the integer constant
+# - iload, istore: the slot of the variable in the variable list
+# - goto, icmpe, icmpge: the absolute address of the jump target
+ICONST = 0
+ILOAD = 1
+ISTORE = 2
+IADD = 3
+ISUB = 4
+IMUL = 5
+IDIV = 6
+PRINT = 7
+GOTO = 8
+ICMPE = 9
+ICMPGE = 10
+# Superinstructions, they are only created by the optimizer (see Optimizer.py) and replace a sequence of instructions
+IINC = 11  # iload a; iconst c; iadd; istore b -> iinc a c b
+IMOV = 12  # iload a; istore b -> imov a b
+ISET = 13  # iconst c; istore b -> iset c b
+IADD_VV = 14  # iload a; iload b; iadd; istore c -> iadd_vv a b c
+ISUB_VV = 15  # iload a; iload b; isub; istore c -> isub_vv a b c
+IMUL_VV = 16  # iload a; iload b; imul; istore c -> imul_vv a b c
+PRINT_V = 17  # iload a; print -> print_v a
+ICMPE_VV = 18  # iload a; iload b; icmpe n -> icmpe_vv a b n
+ICMPE_VC = 19  # iload a; iconst c; icmpe n -> icmpe_vc a c n
+ICMPE_CV = 20  # iconst c; iload b; icmpe n -> icmpe_cv c b n
+ICMPGE_VV = 21  # iload a; iload b; icmpge n -> icmpge_vv a b n
+ICMPGE_VC = 22  # iload a; iconst c; icmpge n -> icmpge_vc a c n
+ICMPGE_CV = 23  # iconst c; iload b; icmpge n -> icmpge_cv c b n
+opcode_names = ["iconst", "iload", "istore", "iadd", "isub", "imul", "idiv", "print", "goto", "icmpe", "icmpge",
+                "iinc", "imov", "iset", "iadd_vv", "isub_vv", "imul_vv", "print_v",
+                "icmpe_vv", "icmpe_vc", "icmpe_cv", "icmpge_vv", "icmpge_vc", "icmpge_cv"]
+# Kinds of the operands of the opcodes: v = slot of a variable, c = constant, a = address
+operand_kinds = ["c", "v", "v", "", "", "", "", "", "a", "a", "a",
+                 "vcv", "vv", "cv", "vvv", "vvv", "vvv", "v",
+                 "vva", "vca", "cva", "vva", "vca", "cva"]
+# Change of the operand stack depth by the opcodes, the superinstructions don't use the stack
+stack_effects = [1, 1, -1, -1, -1, -1, -1, -1, 0, -2, -2,
+                 0, 0, 0, 0, 0, 0, 0,
+                 0, 0, 0, 0, 0, 0]
+opcodes = {name: op for (op, name) in enumerate(opcode_names)}
+jump_ops = {op for (op, kinds) in enumerate(operand_kinds) if kinds.endswith("a")}  # the target is the last operand
+record_width = 4  # ints per instruction in the fixed width layout (see ProgramImage.py): the opcode and 3 operands
+
+
+# Executes the instruction cmd on frame (a FRAME), the jumps set the program counter themselves
+# Used by the loops that execute one instruction at a time with extra work in between (see Profiler.py and Jit.py)
+handlers = {
+    ICONST: lambda f, cmd: f.iconst(cmd[1]),
+    ILOAD: lambda f, cmd: f.iload(cmd[1]),
+    ISTORE: lambda f, cmd: f.istore(cmd[1]),
+    IADD: lambda f, cmd: f.iadd(),
+    ISUB: lambda f, cmd: f.isub(),
+    IMUL: lambda f, cmd: f.imul(),
+    IDIV: lambda f, cmd: f.idiv(),
+    PRINT: lambda f, cmd: f.print(),
+    GOTO: lambda f, cmd: f.goto(cmd[1]),
+    ICMPE: lambda f, cmd: f.icmpe(cmd[1]),
+    ICMPGE: lambda f, cmd: f.icmpge(cmd[1]),
+    IINC: lambda f, cmd: f.iinc(cmd[1], cmd[2], cmd[3]),
+    IMOV: lambda f, cmd: f.imov(cmd[1], cmd[2]),
+    ISET: lambda f, cmd: f.iset(cmd[1], cmd[2]),
+    IADD_VV: lambda f, cmd: f.iadd_vv(cmd[1], cmd[2], cmd[3]),
+    ISUB_VV: lambda f, cmd: f.isub_vv(cmd[1], cmd[2], cmd[3]),
+    IMUL_VV: lambda f, cmd: f.imul_vv(cmd[1], cmd[2], cmd[3]),
+    PRINT_V: lambda f, cmd: f.print_v(cmd[1]),
+    ICMPE_VV: lambda f, cmd: f.jump_if(f.variables[cmd[1]] != f.variables[cmd[2]], cmd[3]),
+    ICMPE_VC: lambda f, cmd: f.jump_if(f.variables[cmd[1]] != cmd[2], cmd[3]),
+    ICMPE_CV: lambda f, cmd: f.jump_if(cmd[1] != f.variables[cmd[2]], cmd[3]),
+    ICMPGE_VV: lambda f, cmd: f.jump_if(f.variables[cmd[1]] < f.variables[cmd[2]], cmd[3]),
+    ICMPGE_VC: lambda f, cmd: f.jump_if(f.variables[cmd[1]] < cmd[2], cmd[3]),
+    ICMPGE_CV: lambda f, cmd: f.jump_if(cmd[1] < f.variables[cmd[2]], cmd[3]),
+}
+
+
+# Returns the instruction at address i of code as a readable string
+def disassemble_instr(code, i, var_names):
+    instr = code[i]
+    tmp = f"{i} : {opcode_names[instr[0]]}"
+    for arg in instr[1:]:
+        tmp += " " + str(arg)
+    names = [var_names[arg] for (arg, kind) in zip(instr[1:], operand_kinds[instr[0]]) if kind == "v"]
+    if names:
+        tmp += f" ({', '.join(names)})"
+    return tmp
+
+
+# Returns the stack depth before every address of code and at its end, None for the addresses that are never reached
+# This is the verification of the code: raises a ValueError if an instruction is malformed (an unknown opcode, a wrong
+# number of operands, a slot that is not one of var_count variables or a jump outside of the code), if the stack depth
+# at an address depends on the path to it or if an instruction pops from the empty stack
+# code is a sequence of instruction tuples, or with width the flat records of width ints per instruction (the records
+# of a program image, see ProgramImage.py), which are read in place without creating the tuples
+def stack_depths(code, var_count=None, width=None):
+    count = len(code) if width is None else len(code) // width
+    ops = [0] * count
+    targets = [0] * count  # jump target of every jump instruction
+    for pc in range(count):
+        if width is None:
+            (op, args) = (code[pc][0], code[pc][1:])
+        else:
+            (op, args) = (code[pc * width], None)
+        if not 0 <= op < len(operand_kinds) or (args is not None and len(args) != len(operand_kinds[op])):
+            raise ValueError(f"The instruction at address {pc} is malformed")
+        kinds = operand_kinds[op]
+        if args is None:
+            args = code[pc * width + 1:pc * width + 1 + len(kinds)]
+        for (kind, arg) in zip(kinds, args):
+            if (kind == "v" and var_count is not None and not 0 <= arg < var_count) or \
+                    (kind == "a" and not 0 <= arg <= count):
+                raise ValueError(f"The operand {arg} of the instruction at address {pc} is out of range")
+        ops[pc] = op
+        if op in jump_ops:
+            targets[pc] = args[-1]
+    depths = [None] * (count + 1)
+    work = [(0, 0)]
+    while work:
+        (pc, depth) = work.pop()
+        if depths[pc] is not None:
+            if depths[pc] != depth:
+                raise ValueError(f"The stack depth at address {pc} depends on the path")
+            continue
+        depths[pc] = depth
+        if pc == count:
+            continue
+        op = ops[pc]
+        depth += stack_effects[op]
+        if depth < 0 or (op in (IADD, ISUB, IMUL, IDIV) and depth < 1):
+            raise ValueError(f"The instruction at address {pc} pops from the empty stack")
+        if op in jump_ops:
+            work.append((targets[pc], depth))
+        if op != GOTO:
+            work.append((pc + 1, depth))
+    return depths
+
+
+# Returns the maximal depth of the operand stack of code, raises a ValueError if the code is malformed (see
+# stack_depths)
+def max_stack_depth(code, var_count=None, width=None):
+    return max(depth for depth in stack_depths(code, var_count, width) if depth is not None)
+
+
+# Returns the source line of the instruction at addr, None if the line table has no line for it
+# The line table is a tuple of pairs (address, line): the instructions from the address up to the address of the next
+# pair belong to the line, a pair is only added where the line changes
+def line_of(line_table, addr):
+    i = bisect_left(line_table, (addr + 1,)) - 1
+    return line_table[i][1] if i >= 0 else None
+
+
+# The compiled program: the bytecode sequence, the label table and the linked code
+# A program is not changed by executing it, every run has its own FRAME, so the same program can be run many times and
+# from several threads without compiling it again. Only the caches of the other engines (native, opt_code) are set
+# later, they are computed from the code and the same for every run
+# A program that was compiled before (see ProgramCache.py) is restored from linked instead of compiling the ast:
+# linked is the tuple (var_names, label_table, code, line_table), the unlinked bytecode sequence is not restored
+class PROGRAM:
+    def __init__(self, ast_root=None, linked=None):
         self.local_var_table = {}
-        self.create_local_var_table(ast_root.get_child(1))
         self.bseq = []
         self.label_table = []  # contains addresses for labels
-        self.create_bytecode_seq(ast_root.get_child(0))
-        self.stack = Stack([])
-        self.bseq_ptr = -1
-        self.p_ctr = 0
+        self.var_names = []  # names of the variables by slot
+        self.code = []  # linked bytecode sequence, this is what is executed
+        self.line_table = []  # source lines of the code (see line_of), empty for syntax trees without positions
+        if linked is None:
+            self.create_local_var_table(ast_root.get_child(1))
+            self.create_bytecode_seq(ast_root.get_child(0))
+            self.link()
+        else:
+            (self.var_names, self.label_table, self.code, self.line_table) = linked
+            self.local_var_table = dict.fromkeys(self.var_names, 0)
+        self.bseq = tuple(self.bseq)
+        self.label_table = tuple(self.label_table)
+        self.var_names = tuple(self.var_names)
+        self.code = tuple(self.code)
+        self.line_table = tuple(self.line_table)
+        self.max_stack = max_stack_depth(self.code, len(self.var_names))  # verifies the code, compiled or restored
+        self.slots = {name: i for (i, name) in enumerate(self.var_names)}
+        self.native = None  # the code compiled to a python function, set by PyCompiler.run_native
+        self.opt_code = None  # the optimized code, set by Optimizer.get_optimized_code
+        self.opt_line_table = ()  # the line table of the optimized code, set with opt_code
+        self.opt_max_stack = 0  # the maximal stack depth of the optimized code, set with opt_code
+        self.hot_loops = {}  # the compiled hot loops by the address of their header, set by Jit.run_jit
+
+    def get_code(self):
+        return self.code
+
+    def get_var_names(self):
+        return self.var_names
+
+    def get_line_table(self):
+        return self.line_table
+
+    # Returns the maximal depth of the operand stack of code (the linked code, the optimized code or any other code for
+    # the variables of the program), raises a ValueError if other code is malformed
+    def get_max_stack(self, code):
+        if code is self.code:
+            return self.max_stack
+        if code is self.opt_code:
+            return self.opt_max_stack
+        return max_stack_depth(code, len(self.var_names))
+
+    # Returns the source line of the instruction at addr of the linked code
+    def get_line(self, addr):
+        return line_of(self.line_table, addr)
+
+    # Returns the variable list for a run, values maps names to their initial value, the other variables are 0
+    def initial_variables(self, values=None):
+        variables = [0] * len(self.var_names)
+        if values:
+            for (name, value) in values.items():
+                if name not in self.slots:
+                    raise NameError(f"Variable '{name}' is not declared")
+                variables[self.slots[name]] = value
+        return variables
+
+    # Returns the values of the variable list by name
+    def variable_values(self, variables):
+        return dict(zip(self.var_names, variables))
+
+    # Executes the program on the stack VM and returns the values of the variables at the end
+    # values are the initial values of the variables, code is the linked code by default, output is the sink of the
+    # print instruction (stdout by default), it is flushed when the program ends
+    def run(self, values=None, code=None, output=None):
+        frame = FRAME(self, values, code, output)
+        try:
+            frame.execute()
+        finally:
+            frame.output.flush()
+        return frame.get_values()
 
     # ast_node must be DECL top node
+    # The names are added from the last to the first declared name (the innermost DECL node first)
     def create_local_var_table(self, ast_node):
-        for child in ast_node.get_children():
-            if child.get_ttype() == "decl":
-                self.create_local_var_table(child)
-            else:
-                self.local_var_table[child.get_value()] = 0
+        names = []
+        while ast_node is not None:
+            next_node = None
+            for child in ast_node.get_children():
+                if child.get_ttype() == "decl":
+                    next_node = child
+                else:
+                    names.append(child.get_value())
+            ast_node = next_node
+        for name in reversed(names):
+            self.local_var_table[name] = 0
 
     def print_local_var_table(self):
         print("_____________________")
         print("Local variable table:")
-        for k in self.local_var_table.keys():
-            print("Name:", k, "| Value:", self.local_var_table[k])
+        for i, name in enumerate(self.var_names):
+            print("Slot:", i, "| Name:", name, "| Value:", 0)
         print("_____________________")
 
     def print_label_table(self):
-        print(self.label_table)
+        print(list(self.label_table))
+
+    def print_line_table(self):
+        print("Lines:", list(self.line_table))
 
     # ast_node must be STMT top node
     # very confusion if and while translation
+    # The nodes are translated with an explicit work list instead of recursion, as the statements of a program are
+    # nested in each other (the rest of the program is the last child of a block or an if statement)
+    # The work list contains the nodes that still have to be translated and functions that have to run in between
     def create_bytecode_seq(self, ast_node):
-        if ast_node is None:
-            return
-        if ast_node.get_ttype() == "assign":
-            self.create_bytecode_seq(ast_node.get_child(0))
-            self.bseq.append(("istore", ast_node.get_child(1).get_value()))
-        elif ast_node.get_ttype() in binop:
-            self.create_bytecode_seq(ast_node.get_child(1))
-            self.create_bytecode_seq(ast_node.get_child(0))
-            self.bseq.append(binop_map[ast_node.get_ttype()])
-        elif ast_node.get_ttype() == "print":
-            self.create_bytecode_seq(ast_node.get_child(0))
-            self.bseq.append("print")
-        elif ast_node.get_ttype() == "number":
-            self.bseq.append(("iconst", ast_node.get_value()))
-        elif ast_node.get_ttype() == "name":
-            self.bseq.append(("iload", ast_node.get_value()))
-        elif ast_node.get_ttype() == "while":
-            next_block = None
-            loop_label = len(self.label_table)  # Index of loop label in label table
-            self.label_table.append(len(self.bseq))  # Address to which goto should jmp in bseq
-            end_label = len(self.label_table)  # Index of end label in label table
-            # Address to which failed cmp should jmp in bseq, will be set after evaluating loop body
-            self.label_table.append(-1)
-            self.create_bytecode_seq(ast_node.get_child(1))  # Add cmp arguments to bseq
-            # Add cmp type with label to stack
-            self.bseq.append((cmp_map[ast_node.get_child(1).get_ttype()], end_label))
-            if len(ast_node.get_child(0).get_children()) > 1:
-                body_child = ast_node.get_child(0).get_child(1)
-                next_block = ast_node.get_child(0).get_child(0)  # recurse on block after while
-                self.create_bytecode_seq(body_child)  # Add loop body to stack
-            else:
-                self.create_bytecode_seq(ast_node.get_child(0))  # Add loop body to stack
-            self.bseq.append(("goto", loop_label))
-            self.label_table[end_label] = len(self.bseq)  # Set the loop label
-            if next_block is not None:
-                self.create_bytecode_seq(next_block)
-        elif ast_node.get_ttype() == "if":
-            child_len = len(ast_node.get_children())
-            next_block_label = len(self.label_table)
-            self.label_table.append(-1)
-
-            self.create_bytecode_seq(ast_node.get_child(child_len-1))  # Add cmp arguments to bseq
-            self.bseq.append((cmp_map[ast_node.get_child(child_len-1).get_ttype()], next_block_label))  #  add cmp to bseq
-            self.create_bytecode_seq(ast_node.get_child(child_len-2))  # add if block to bseq
-
-            if ast_node.get_child(0).get_ttype() == "else":
-                else_node = ast_node.get_child(0)
-                else_child_len = len(else_node.get_children())
-
-                skip_else_label = len(self.label_table)
-                self.bseq.append(("goto", skip_else_label))  # after executing if block skip else block
+        work = [ast_node]
+        while work:
+            ast_node = work.pop()
+            if ast_node is None:
+                continue
+            if not isinstance(ast_node, AST_NODE):
+                ast_node()
+                continue
+            # the tasks are pushed in reverse order, the last pushed task is executed first
+            if ast_node.get_ttype() in statements:
+                self.add_line(ast_node)
+            if ast_node.get_ttype() == "assign":
+                work.append(partial(self.bseq.append, ("istore", ast_node.get_child(1).get_value())))
+                work.append(ast_node.get_child(0))
+            elif ast_node.get_ttype() in binop:
+                work.append(partial(self.bseq.append, binop_map[ast_node.get_ttype()]))
+                work.append(ast_node.get_child(0))
+                work.append(ast_node.get_child(1))
+            elif ast_node.get_ttype() == "print":
+                work.append(partial(self.bseq.append, "print"))
+                work.append(ast_node.get_child(0))
+            elif ast_node.get_ttype() == "number":
+                self.bseq.append(("iconst", ast_node.get_value()))
+            elif ast_node.get_ttype() == "name":
+                self.bseq.append(("iload", ast_node.get_value()))
+            elif ast_node.get_ttype() == "while":
+                next_block = None
+                loop_label = len(self.label_table)  # Index of loop label in label table
+                self.label_table.append(len(self.bseq))  # Address to which goto should jmp in bseq
+                end_label = len(self.label_table)  # Index of end label in label table
+                # Address to which failed cmp should jmp in bseq, will be set after evaluating loop body
+                self.label_table.append(-1)
+                # a body without braces is a block of the first statement and the block after the while
+                if ast_node.get_child(0).get_ttype() == "block" and len(ast_node.get_child(0).get_children()) > 1:
+                    body_child = ast_node.get_child(0).get_child(1)
+                    next_block = ast_node.get_child(0).get_child(0)  # recurse on block after while
+                else:
+                    body_child = ast_node.get_child(0)
+                work.append(next_block)
+                work.append(partial(self.set_label, end_label))  # Set the loop label
+                work.append(partial(self.bseq.append, ("goto", loop_label)))
+                work.append(partial(self.add_line, ast_node))  # the goto belongs to the line of the while
+                work.append(body_child)  # Add loop body to stack
+                # Add cmp type with label to stack
+                work.append(partial(self.bseq.append, (cmp_map[ast_node.get_child(1).get_ttype()], end_label)))
+                work.append(ast_node.get_child(1))  # Add cmp arguments to bseq
+            elif ast_node.get_ttype() == "if":
+                child_len = len(ast_node.get_children())
+                next_block_label = len(self.label_table)
                 self.label_table.append(-1)
 
-                self.label_table[next_block_label] = len(self.bseq)  # if else cond fails, jmp to else block
-                self.create_bytecode_seq(else_node.get_child(else_child_len - 1))  # add else block to bseq
-
-                if else_child_len == 2:  # if there is a block after else block add it to bseq
-                    self.create_bytecode_seq(else_node.get_child(else_child_len - 2))
-
-                self.label_table[skip_else_label] = len(self.bseq)
-            else:  # there is no else block
-                self.label_table[next_block_label] = len(self.bseq)
-                if len(ast_node.get_children()) == 3:  # there is a block after the if statement
-                    self.create_bytecode_seq(ast_node.get_child(0))  # add block to bseq
+                if ast_node.get_child(0).get_ttype() == "else":
+                    work.append(partial(self.create_else_seq, ast_node, next_block_label, work))
+                else:  # there is no else block
+                    if len(ast_node.get_children()) == 3:  # there is a block after the if statement
+                        work.append(ast_node.get_child(0))  # add block to bseq
+                    work.append(partial(self.set_label, next_block_label))
+                if child_len > 1:  # an if block without statements only has the predicate
+                    work.append(ast_node.get_child(child_len - 2))  # add if block to bseq
+                #  add cmp to bseq
+                work.append(partial(self.bseq.append, (cmp_map[ast_node.get_child(child_len - 1).get_ttype()],
+                                                       next_block_label)))
+                work.append(ast_node.get_child(child_len - 1))  # Add cmp arguments to bseq
+            else:
+                work.extend(ast_node.get_children())  # the last child is translated first
 
+    # Sets the label to the address of the next instruction
+    def set_label(self, label):
+        self.label_table[label] = len(self.bseq)
 
-        else:
-            for child in reversed(ast_node.get_children()):
-                self.create_bytecode_seq(child)
+    # Adds the line of the statement ast_node for the next instruction to the line table
+    def add_line(self, ast_node):
+        line = ast_node.get_line()
+        if line is None:
+            return
+        addr = len(self.bseq)
+        if self.line_table and self.line_table[-1][0] == addr:  # the previous statement has no instructions
+            self.line_table.pop()
+        if not self.line_table or self.line_table[-1][1] != line:
+            self.line_table.append((addr, line))
+
+    # Translates the else part of the if statement if_node, is called after the if block has been added to bseq
+    def create_else_seq(self, if_node, next_block_label, work):
+        else_node = if_node.get_child(0)
+        else_child_len = len(else_node.get_children())
+
+        self.add_line(if_node)  # the goto belongs to the line of the if
+        skip_else_label = len(self.label_table)
+        self.bseq.append(("goto", skip_else_label))  # after executing if block skip else block
+        self.label_table.append(-1)
+
+        self.label_table[next_block_label] = len(self.bseq)  # if else cond fails, jmp to else block
+        work.append(partial(self.set_label, skip_else_label))
+        if else_child_len == 2:  # if there is a block after else block add it to bseq
+            work.append(else_node.get_child(else_child_len - 2))
+        if else_child_len > 0:  # an else block without braces has no children if it is a single statement
+            work.append(else_node.get_child(else_child_len - 1))  # add else block to bseq
+
+    # Translates the bytecode sequence into the linked code: the opcodes are ints, the variables are slots in a list,
+    # the constants are parsed and the jumps go to absolute addresses instead of entries of the label table
+    def link(self):
+        slots = {name: i for (i, name) in enumerate(self.local_var_table.keys())}
+        self.var_names = list(slots.keys())
+        self.code = []
+        for b in self.bseq:
+            if isinstance(b, str):
+                self.code.append((opcodes[b],))
+            elif b[0] == "iconst":
+                self.code.append((ICONST, int(b[1])))
+            elif b[0] == "iload" or b[0] == "istore":
+                if b[1] not in slots:
+                    line = line_of(self.line_table, len(self.code))
+                    raise NameError(f"Variable '{b[1]}' is not declared" + (f" (line {line})" if line else ""))
+                self.code.append((opcodes[b[0]], slots[b[1]]))
+            else:
+                self.code.append((opcodes[b[0]], self.label_table[b[1]]))
 
     def print_bytecode_seq(self):
-        for i, b in enumerate(self.bseq):
-            print(i, ":", b)
-
-    def execute_bytecode(self):
-        while self.p_ctr < len(self.bseq):
-            cmd = self.bseq[self.p_ctr]
-
-            if cmd == "iadd":
-                self.iadd()
-            elif cmd == "isub":
-                self.isub()
-            elif cmd == "imul":
-                self.imul()
-            elif cmd == "idiv":
-                self.idiv()
-            elif cmd == "print":
-                self.print()
-            elif cmd[0] == "iconst":
-                self.iconst(cmd[1])
-            elif cmd[0] == "iload":
-                self.iload(cmd[1])
-            elif cmd[0] == "istore":
-                self.istore(cmd[1])
-            elif cmd[0] == "goto":
-                self.goto(cmd[1])
-                continue
-            elif cmd[0] == "icmpe":
-                self.icmpe(cmd[1])
-                continue
-            elif cmd[0] == "icmpge":
-                self.icmpge(cmd[1])
-                continue
-            self.p_ctr = self.p_ctr + 1
-
+        code = self.get_code()
+        for i in range(len(code)):
+            print(disassemble_instr(code, i, self.var_names))
+
+
+# The state of one run of a PROGRAM: the variables, the operand stack and the program counter
+# The operand stack is allocated once with the maximal stack depth of the code (see stack_depths), sp is the number of
+# values on it, so push and pop only move sp. The values above sp are left over from earlier instructions
+class FRAME:
+    __slots__ = ("program", "code", "variables", "stack", "sp", "p_ctr", "output")
+
+    # code is the linked code of the program by default, the optimized code (see Optimizer.py) may contain
+    # superinstructions, output is the sink of the print instruction (see Output.py)
+    def __init__(self, program, values=None, code=None, output=None):
+        self.program = program
+        self.code = program.get_code() if code is None else code
+        self.output = OUTPUT() if output is None else output
+        self.variables = program.initial_variables(values)
+        self.stack = [0] * program.get_max_stack(self.code)
+        self.sp = 0
         self.p_ctr = 0
-        for key in self.local_var_table.keys():
-            self.local_var_table[key] = 0
-        print("exit 0")
+
+    def get_values(self):
+        return self.program.variable_values(self.variables)
+
+    # All instructions are executed inline on locals: the program counter, the stack pointer, the stack and the
+    # variables. The superinstructions of the optimized code are tested before the base instructions, so the fused
+    # instructions don't pay for the tests of the instructions they replace
+    def execute(self):
+        code = self.code
+        count = len(code)
+        stack = self.stack
+        variables = self.variables
+        pc = self.p_ctr
+        sp = self.sp
+        try:
+            while pc < count:
+                cmd = code[pc]
+                op = cmd[0]
+
+                if op >= IINC:
+                    if op == IINC:
+                        variables[cmd[3]] = variables[cmd[1]] + cmd[2]
+                    elif op == ICMPGE_VV:
+                        pc = cmd[3] if variables[cmd[1]] < variables[cmd[2]] else pc + 1
+                        continue
+                    elif op == ICMPGE_VC:
+                        pc = cmd[3] if variables[cmd[1]] < cmd[2] else pc + 1
+                        continue
+                    elif op == ICMPGE_CV:
+                        pc = cmd[3] if cmd[1] < variables[cmd[2]] else pc + 1
+                        continue
+                    elif op == IADD_VV:
+                        variables[cmd[3]] = variables[cmd[1]] + variables[cmd[2]]
+                    elif op == IMUL_VV:
+                        variables[cmd[3]] = variables[cmd[1]] * variables[cmd[2]]
+                    elif op == ISUB_VV:
+                        variables[cmd[3]] = variables[cmd[1]] - variables[cmd[2]]
+                    elif op == IMOV:
+                        variables[cmd[2]] = variables[cmd[1]]
+                    elif op == ISET:
+                        variables[cmd[2]] = cmd[1]
+                    elif op == PRINT_V:
+                        self.output.print(variables[cmd[1]])
+                    elif op == ICMPE_VV:
+                        pc = cmd[3] if variables[cmd[1]] != variables[cmd[2]] else pc + 1
+                        continue
+                    elif op == ICMPE_VC:
+                        pc = cmd[3] if variables[cmd[1]] != cmd[2] else pc + 1
+                        continue
+                    elif op == ICMPE_CV:
+                        pc = cmd[3] if cmd[1] != variables[cmd[2]] else pc + 1
+                        continue
+                elif op == ILOAD:
+                    stack[sp] = variables[cmd[1]]
+                    sp += 1
+                elif op == ICONST:
+                    stack[sp] = cmd[1]
+                    sp += 1
+                elif op == ISTORE:
+                    sp -= 1
+                    variables[cmd[1]] = stack[sp]
+                elif op == IADD:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] + stack[sp]
+                elif op == ISUB:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] - stack[sp]
+                elif op == IMUL:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] * stack[sp]
+                elif op == IDIV:
+                    sp -= 1
+                    stack[sp - 1] = int(stack[sp - 1] / stack[sp])
+                elif op == PRINT:
+                    sp -= 1
+                    self.output.print(stack[sp])
+                elif op == GOTO:
+                    pc = cmd[1]
+                    continue
+                elif op == ICMPE:
+                    sp -= 2
+                    pc = cmd[1] if stack[sp + 1] != stack[sp] else pc + 1
+                    continue
+                elif op == ICMPGE:
+                    sp -= 2
+                    pc = cmd[1] if stack[sp + 1] > stack[sp] else pc + 1
+                    continue
+                pc += 1
+        finally:
+            (self.p_ctr, self.sp) = (pc, sp)
+
+    # Executes the fixed width records of a program image (see ProgramImage.py) like execute, code is a flat sequence of
+    # ints with record_width ints per instruction, so the instructions are read without creating a tuple for every
+    # instruction
+    def execute_records(self):
+        code = self.code
+        count = len(code) // record_width
+        stack = self.stack
+        variables = self.variables
+        pc = self.p_ctr
+        sp = self.sp
+        try:
+            while pc < count:
+                base = pc * record_width
+                op = code[base]
+
+                if op >= IINC:
+                    if op == IINC:
+                        variables[code[base + 3]] = variables[code[base + 1]] + code[base + 2]
+                    elif op == ICMPGE_VV:
+                        pc = code[base + 3] if variables[code[base + 1]] < variables[code[base + 2]] else pc + 1
+                        continue
+                    elif op == ICMPGE_VC:
+                        pc = code[base + 3] if variables[code[base + 1]] < code[base + 2] else pc + 1
+                        continue
+                    elif op == ICMPGE_CV:
+                        pc = code[base + 3] if code[base + 1] < variables[code[base + 2]] else pc + 1
+                        continue
+                    elif op == IADD_VV:
+                        variables[code[base + 3]] = variables[code[base + 1]] + variables[code[base + 2]]
+                    elif op == IMUL_VV:
+                        variables[code[base + 3]] = variables[code[base + 1]] * variables[code[base + 2]]
+                    elif op == ISUB_VV:
+                        variables[code[base + 3]] = variables[code[base + 1]] - variables[code[base + 2]]
+                    elif op == IMOV:
+                        variables[code[base + 2]] = variables[code[base + 1]]
+                    elif op == ISET:
+                        variables[code[base + 2]] = code[base + 1]
+                    elif op == PRINT_V:
+                        self.output.print(variables[code[base + 1]])
+                    elif op == ICMPE_VV:
+                        pc = code[base + 3] if variables[code[base + 1]] != variables[code[base + 2]] else pc + 1
+                        continue
+                    elif op == ICMPE_VC:
+                        pc = code[base + 3] if variables[code[base + 1]] != code[base + 2] else pc + 1
+                        continue
+                    elif op == ICMPE_CV:
+                        pc = code[base + 3] if code[base + 1] != variables[code[base + 2]] else pc + 1
+                        continue
+                elif op == ILOAD:
+                    stack[sp] = variables[code[base + 1]]
+                    sp += 1
+                elif op == ICONST:
+                    stack[sp] = code[base + 1]
+                    sp += 1
+                elif op == ISTORE:
+                    sp -= 1
+                    variables[code[base + 1]] = stack[sp]
+                elif op == IADD:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] + stack[sp]
+                elif op == ISUB:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] - stack[sp]
+                elif op == IMUL:
+                    sp -= 1
+                    stack[sp - 1] = stack[sp - 1] * stack[sp]
+                elif op == IDIV:
+                    sp -= 1
+                    stack[sp - 1] = int(stack[sp - 1] / stack[sp])
+                elif op == PRINT:
+                    sp -= 1
+                    self.output.print(stack[sp])
+                elif op == GOTO:
+                    pc = code[base + 1]
+                    continue
+                elif op == ICMPE:
+                    sp -= 2
+                    pc = code[base + 1] if stack[sp + 1] != stack[sp] else pc + 1
+                    continue
+                elif op == ICMPGE:
+                    sp -= 2
+                    pc = code[base + 1] if stack[sp + 1] > stack[sp] else pc + 1
+                    continue
+                pc += 1
+        finally:
+            (self.p_ctr, self.sp) = (pc, sp)
+
+    # Executes at most steps instructions of the tuple code, returns the number of executed instructions
+    # The run can be continued by calling execute_steps again, it has ended when finished() is True
+    def execute_steps(self, steps):
+        code = self.code
+        executed = 0
+        while executed < steps and self.p_ctr < len(code):
+            cmd = code[self.p_ctr]
+            op = cmd[0]
+            handlers[op](self, cmd)
+            if op not in jump_ops:
+                self.p_ctr = self.p_ctr + 1
+            executed = executed + 1
+        return executed
+
+    def finished(self):
+        return self.p_ctr >= len(self.code)
 
     def iconst(self, v):
-        self.stack.push(v)
+        self.stack[self.sp] = v
+        self.sp += 1
 
-    def istore(self, x):
-        self.local_var_table[x] = self.stack.pop()
+    def istore(self, slot):
+        self.sp -= 1
+        self.variables[slot] = self.stack[self.sp]
 
-    def iload(self, x):
-        self.stack.push(self.local_var_table[x])
+    def iload(self, slot):
+        self.stack[self.sp] = self.variables[slot]
+        self.sp += 1
 
     def print(self):
-        print("<print>", self.stack.pop())
+        self.sp -= 1
+        self.output.print(self.stack[self.sp])
 
     def goto(self, addr):
-        self.p_ctr = self.label_table[int(addr)]
+        self.p_ctr = addr
 
     def icmpe(self, addr):
-        a = int(self.stack.pop())
-        b = int(self.stack.pop())
-        if a != b:
-            self.p_ctr = self.label_table[int(addr)]
-        else:
-            self.p_ctr = self.p_ctr + 1
+        self.sp -= 2
+        self.jump_if(self.stack[self.sp + 1] != self.stack[self.sp], addr)
 
     def icmpge(self, addr):
-        a = int(self.stack.pop())
-        b = int(self.stack.pop())
-        if a > b:
-            self.p_ctr = self.label_table[int(addr)]
-        else:
-            self.p_ctr = self.p_ctr + 1
-
+        self.sp -= 2
+        self.jump_if(self.stack[self.sp + 1] > self.stack[self.sp], addr)
 
     def iadd(self):
-        self.stack.push(int(self.stack.pop()) + int(self.stack.pop()))
+        self.sp -= 1
+        self.stack[self.sp - 1] = self.stack[self.sp - 1] + self.stack[self.sp]
 
     def isub(self):
-        b = int(self.stack.pop())
-        a = int(self.stack.pop())
-        self.stack.push(a - b)
+        self.sp -= 1
+        self.stack[self.sp - 1] = self.stack[self.sp - 1] - self.stack[self.sp]
 
     def imul(self):
-        self.stack.push(int(self.stack.pop()) * int(self.stack.pop()))
+        self.sp -= 1
+        self.stack[self.sp - 1] = self.stack[self.sp - 1] * self.stack[self.sp]
 
     def idiv(self):
-        b = int(self.stack.pop())
-        a = int(self.stack.pop())
-        self.stack.push(int(a / b))
-
-
+        self.sp -= 1
+        self.stack[self.sp - 1] = int(self.stack[self.sp - 1] / self.stack[self.sp])
 
+    # Superinstructions
 
+    def iinc(self, a, c, b):
+        self.variables[b] = self.variables[a] + c
 
+    def imov(self, a, b):
+        self.variables[b] = self.variables[a]
 
+    def iset(self, c, b):
+        self.variables[b] = c
 
+    def iadd_vv(self, a, b, c):
+        self.variables[c] = self.variables[a] + self.variables[b]
 
+    def isub_vv(self, a, b, c):
+        self.variables[c] = self.variables[a] - self.variables[b]
 
+    def imul_vv(self, a, b, c):
+        self.variables[c] = self.variables[a] * self.variables[b]
 
+    def print_v(self, a):
+        self.output.print(self.variables[a])
 
+    # Jump of the fused compare instructions, the condition is the one of icmpe and icmpge with the operands in the
+    # order they were pushed
+    def jump_if(self, cond, addr):
+        if cond:
+            self.p_ctr = addr
+        else:
+            self.p_ctr = self.p_ctr + 1
 
 
+# Executes the linked code of the program on the stack VM and returns the values of the variables at the end
+def run_stack(program, values=None, output=None):
+    return program.run(values, output=output)
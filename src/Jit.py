@@ -0,0 +1,90 @@
+from Interpreter import *
+from PyCompiler import py_name
+from PyCompiler import translate_range
+
+# JIT compiler for the hot while loops
+# The program is interpreted, but every goto that jumps backwards (the end of a while loop) counts its executions.
+# When a loop has run hot_loop_threshold times, its bytecode from the header (the condition) to the goto is compiled
+# into a python function (see PyCompiler.py): the variables of the loop become locals, the constants are inlined and
+# the loop is a native while loop. The function runs the loop until it exits, then the interpreter continues after the
+# loop. Whenever the interpreter reaches the header of a compiled loop again, the function is called directly
+# The compiled loops are kept in the program, so later runs of the program start with them. The cold code before and
+# between the loops is never compiled
+
+hot_loop_threshold = 16  # iterations of a loop before it is compiled
+
+
+# A compiled loop: function gets the print function and the values of the variables in slots, returns the values of
+# the variables in stores, exit is the address after the loop
+class HOT_LOOP:
+    def __init__(self, function, slots, stores, exit_addr):
+        self.function = function
+        self.slots = slots
+        self.stores = stores
+        self.exit = exit_addr
+
+
+# Returns the compiled loop from header to the goto at back_edge, raises a ValueError if it can't be compiled
+def compile_loop(code, header, back_edge, var_names):
+    loop_code = code[header:back_edge + 1]
+    slots = sorted({instr[1] for instr in loop_code if instr[0] == ILOAD or instr[0] == ISTORE})
+    stores = sorted({instr[1] for instr in loop_code if instr[0] == ISTORE})
+    lines = [f"def loop({', '.join(['emit'] + [py_name(var_names, slot) for slot in slots])}):"]
+    try:
+        translate_range(code, header, back_edge + 1, var_names, lines, "    ")
+        if len(lines) < 2 or not lines[1].startswith("    while "):
+            raise ValueError(f"The code at address {header} is not a while loop")
+        lines.append(f"    return [{', '.join(py_name(var_names, slot) for slot in stores)}]")
+        namespace = {}
+        exec(compile("\n".join(lines) + "\n", f"<mmjava loop {header}>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError) as e:  # too deeply nested for the python compiler
+        raise ValueError(f"Python can't compile the loop at address {header}: {e}")
+    return HOT_LOOP(namespace["loop"], slots, stores, back_edge + 1)
+
+
+# Executes the program with the JIT and returns the values of the variables at the end
+def run_jit(program, values=None, output=None):
+    frame = FRAME(program, values, output=output)
+    code = frame.code
+    variables = frame.variables
+    emit = frame.output.print
+    hot_loops = program.hot_loops  # header -> HOT_LOOP, or None for a loop that can't be compiled
+    entries = [hot_loops.get(pc) for pc in range(len(code))]  # the compiled loop of every header
+    back_edges = [0] * len(code)
+    try:
+        while frame.p_ctr < len(code):
+            pc = frame.p_ctr
+            loop = entries[pc]
+            if loop is not None and frame.sp == 0:
+                for (slot, value) in zip(loop.stores, loop.function(emit, *[variables[slot] for slot in loop.slots])):
+                    variables[slot] = value
+                frame.p_ctr = loop.exit
+                continue
+            cmd = code[pc]
+            op = cmd[0]
+            # the linked code only has the base opcodes, they are dispatched like in FRAME.execute
+            if op == ILOAD:
+                frame.iload(cmd[1])
+            elif op == ICONST:
+                frame.iconst(cmd[1])
+            elif op == ISTORE:
+                frame.istore(cmd[1])
+            elif op == GOTO:
+                if cmd[1] <= pc:  # the back edge of a loop
+                    back_edges[pc] += 1
+                    if back_edges[pc] == hot_loop_threshold and cmd[1] not in hot_loops:
+                        try:
+                            hot_loops[cmd[1]] = compile_loop(code, cmd[1], pc, program.get_var_names())
+                        except ValueError:
+                            hot_loops[cmd[1]] = None
+                        entries[cmd[1]] = hot_loops[cmd[1]]
+                frame.p_ctr = cmd[1]
+                continue
+            else:
+                handlers[op](frame, cmd)
+                if op in jump_ops:
+                    continue
+            frame.p_ctr = pc + 1
+    finally:
+        frame.output.flush()
+    return frame.get_values()
@@ -1,17 +1,40 @@
 import re
 
-symbols = ["==", "=", ">=", ";", "\(", "\)", "\{", "\}", "\+", "-", "/", "\*", "print", "if", "while",
-           "else", "[a-z,A-Z]", "[1-9][0-9]*|0", '".+"', ","]            #  check how numbers are handled
 token_types = {"=": "equal", "==": "d_equal", ">=": "greater_equal", ";": "semicolon",
                "(": "lparen", ")": "rparen", "{": "lbrace", "}": "rbrace",
                "+": "plus", "-": "minus", "*": "mul", "/": "div",
                "print": "print", "if": "if", "else": "else", ",": "comma", "while": "while"}
+keywords = {symbol: ttype for (symbol, ttype) in token_types.items() if symbol.isalpha()}
 
+# Every terminal has a small integer id, the tokens carry it so that the parser can index its table with it
+terminal_types = ["$", "name", "number", "string"] + list(dict.fromkeys(token_types.values()))
+token_ids = {ttype: i for (i, ttype) in enumerate(terminal_types)}
+symbol_ids = {symbol: token_ids[ttype] for (symbol, ttype) in token_types.items()}
 
+
+# One precompiled regex for all symbols, the name of the matching group classifies the symbol
+# Words are matched as a whole and are either a keyword or a name, characters that match no group are skipped
+# Newlines are matched as well to count the lines
+token_regex = re.compile(r'(?P<number>[1-9][0-9]*|0)'
+                         r'|(?P<name>[a-zA-Z]+)'
+                         r'|(?P<string>".+")'
+                         r'|(?P<symbol>==|>=|[=;(){}+\-/*,])'
+                         r'|(?P<newline>\n)')
+
+
+# tid is the id of ttype in token_ids, it is only set for the tokens of the lexer
+# offset is the index of the token in the program string, line and col its position (starting at 1), they are only set
+# for the tokens of the lexer, the other tokens have the line 0
 class Token:
-    def __init__(self, ttype, value):
+    __slots__ = ("ttype", "value", "tid", "offset", "line", "col")
+
+    def __init__(self, ttype, value, tid=-1, offset=-1, line=0, col=0):
         self.ttype = ttype
         self.value = value
+        self.tid = tid
+        self.offset = offset
+        self.line = line
+        self.col = col
 
     def to_string(self):
         return "[" + self.ttype + ": '" + self.value + "']"
@@ -22,35 +45,54 @@ class Token:
     def get_value(self):
         return self.value
 
+    def get_tid(self):
+        return self.tid
+
+    def get_offset(self):
+        return self.offset
+
+    def get_line(self):
+        return self.line
+
+    def get_col(self):
+        return self.col
+
+    # Returns the span (line, col, end line, end col) of the token, the end is exclusive, None if it has no position
+    def get_span(self):
+        if self.line == 0:
+            return None
+        return self.line, self.col, self.line, self.col + len(self.value)
+
     def print(self):
         print(self.to_string())
 
 
-# Creates regex string for function tokenize_program_str out of symbols
-def create_regex():
-    str = ""
-    for s in symbols:
-        str += s + "|"
-    return str[:-1]
+# Generates the tokens of the program one after another, ends with the "$" token
+# The parser consumes this generator directly, so the program is never held as a list of tokens
+def generate_tokens(program_str):
+    line = 1
+    line_start = 0  # offset of the first character of the line
+    for match in token_regex.finditer(program_str):  # Classify symbols by the group that matched
+        kind = match.lastgroup
+        symbol = match[0]
+        start = match.start()
+        if kind == "newline":
+            line += 1
+            line_start = start + 1
+        elif kind == "symbol":
+            yield Token(token_types[symbol], symbol, symbol_ids[symbol], start, line, start - line_start + 1)
+        elif kind == "name":
+            ttype = keywords.get(symbol, "name")
+            yield Token(ttype, symbol, token_ids[ttype], start, line, start - line_start + 1)
+        else:  # number or string
+            yield Token(kind, symbol, token_ids[kind], start, line, start - line_start + 1)
+    end = len(program_str)
+    yield Token("$", "$", token_ids["$"], end, line, end - line_start + 1)
 
 
 # Transforms the program into a list of tokens
 def tokenize_program_str(program_str):
-    symbol_list = re.findall(create_regex(), program_str)  # Get symbols
-    token_list = []
-    for symbol in symbol_list:  # Classify symbols
-        if token_types.get(symbol) is None:
-            # Classify dynamic symbols (e.g: 12 -> NUMBER: 12)
-            if re.search("[0-9]", symbol):  # is symbol number?
-                token_list.append(Token("number", symbol))
-            elif re.search('"', symbol):  # is symbol string?
-                token_list.append(Token("string", symbol))
-            else:  # Symbol is name
-                token_list.append(Token("name", symbol))
-        else:
-            token_list.append(Token(token_types[symbol], symbol))  # Assign symbol to token out of token types
-    token_list.append(Token("$", "$"))
-    return token_list
+    return list(generate_tokens(program_str))
 
 
 program_0 = 'a = 300; ' \
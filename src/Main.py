@@ -1,10 +1,27 @@
+import argparse
 import re
+import sys
+import time
 
-from Lexer import tokenize_program_str
+from Lexer import generate_tokens
 from Parser import token_str_to_ast
 from Parser import parse_error
 from PDA_render import render_ast
 from Interpreter import *
+from Engines import engines
+from Output import OUTPUT
+from Batch import run_batch
+from Optimizer import print_optimized_code
+from Optimizer import get_optimized_code
+from Profiler import run_profiled
+from Profiler import profile_report
+from VectorVM import run_vectorized
+from VectorVM import grid_inputs
+from AstOptimizer import optimize_ast
+from ProgramCache import load_program
+from ProgramCache import store_program
+from ProgramImage import write_image
+from ProgramImage import MAPPED_PROGRAM
 
 p0 = "a, b;" \
      "while (3 >= a) {" \
@@ -44,40 +61,77 @@ pmin = "a;" \
 
 help_str = """+ print help: -help
 + exit interpreter: exit
-+ load program: load [program name] 
-+ execute program: execute 
++ load program: load [program name] [-O], -O optimizes the syntax tree
++ execute program: execute [engine] [> file], engines: stack (default), optimized, threaded, native, jit
++ profile program: profile [optimized], executes the program with counts and times per instruction and prints the
+  report with the hottest loops (on the optimized code with optimized)
++ parameter sweep: sweep [name=start:stop[:step] | name=v1,v2,...]... [optimized] [> file], executes the program for
+  all combinations of the initial values at once (vectorized with numpy if it is installed)
 + render ast: render_ast
-+ render bytecode sequence: print_bseq"""
++ render bytecode sequence: print_bseq
++ write program image: write_image [image name], load [image name] executes the image from a memory mapped file
+  (image names end with .mmji)"""
 
 
-def print_prog_not_found_str(cmd):
-    print(f"No program found, please load a program before using {cmd}")
+arg_parser = argparse.ArgumentParser(description="MiniMini-Java-Interpreter, without programs the interactive "
+                                                 "interpreter is started")
+arg_parser.add_argument("programs", nargs="*",
+                        help="run the programs in batch mode: program files, directories or glob patterns")
+arg_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: all cores)")
+arg_parser.add_argument("-O", action="store_true", help="optimize the syntax trees")
+arg_parser.add_argument("--engine", choices=list(engines), default="stack", help="engine that executes the programs")
+arg_parser.add_argument("--summary", help="write the results as json to this file")
+arg_parser.add_argument("--output-dir", help="write the output of every program into this directory")
+arg_parser.add_argument("--profile", action="store_true",
+                        help="profile the programs, the reports are written into the summary and the output directory")
 
 
-new_line_chars = {";", "{", "}"}
+# Returns the initial values of a sweep argument name=start:stop[:step] or name=v1,v2,..., raises a ValueError
+def parse_sweep_range(arg):
+    (name, values) = arg.split("=")
+    if ":" in values:
+        return name, range(*[int(v) for v in values.split(":")])
+    return name, [int(v) for v in values.split(",")]
 
 
-def print_parse_error(token_l, pos):
-    offset = 0
-    for i, token in enumerate(token_l):
-        cut_of = len(token.get_value()) - 1
-        if i == pos:
-            print(token.get_value()[:cut_of], " <----- Syntax Error")
-            print(" " * offset + "^" * len(token.get_value()))
-            break
-        if token.get_value() in new_line_chars:
-            print(token.get_value())
-            offset = 0
-        else:
-            print(token.get_value(), end='')
-            offset = offset + len(token.get_value())
+def print_sweep_summary(values, errors, n, seconds):
+    print(f"{n} runs in {seconds:.3f}s, {len(errors)} errors")
+    for (lane, error) in list(errors.items())[:5]:
+        print(f"  run {lane}: {type(error).__name__}: {error}")
+    for (name, column) in values.items():
+        print(f"  {name}: min {min(column)}, max {max(column)}")
+
+
+def print_prog_not_found_str(cmd):
+    print(f"No program found, please load a program before using {cmd}")
+
+
+# Prints the line of the program with the token at which the syntax error occurred
+def print_parse_error(program_str, token):
+    start = program_str.rfind("\n", 0, token.get_offset()) + 1
+    end = program_str.find("\n", token.get_offset())
+    line_str = program_str[start:] if end == -1 else program_str[start:end]
+    print(f"Syntax Error in line {token.get_line()}, column {token.get_col()}:")
+    print(line_str)
+    # tabs are kept, so that the marker is below the token
+    indent = "".join(c if c == "\t" else " " for c in line_str[:token.get_col() - 1])
+    print(indent + "^" * len(token.get_value()))
 
 
 if __name__ == '__main__':
+    args = arg_parser.parse_args()
+    if args.programs:
+        try:
+            sys.exit(run_batch(args.programs, args.jobs, args.engine, args.O, args.summary, args.output_dir,
+                               args.profile))
+        except ValueError as e:
+            arg_parser.error(str(e))
+
     program_name = None
     program_str = None
     program_ast = None
-    interpreter = None
+    optimized = False
+    program = None
 
     print("/-----------------------/")
     print("MiniMini-Java-Interpreter")
@@ -93,22 +147,97 @@ if __name__ == '__main__':
         elif cmd == "exit":
             break
         elif cmd == "execute":
-            if interpreter is None:
+            args = [arg for arg in user_input[1:] if arg != ""]
+            output_name = None
+            if ">" in args and args.index(">") == len(args) - 2:  # the output is written to the file after ">"
+                output_name = args[-1]
+                args = args[:-2]
+            engine_name = args[0] if args else "stack"
+            if program is None:
                 print_prog_not_found_str("execute")
+            elif engine_name not in engines:
+                print(f"Unknown engine '{engine_name}'")
+            elif output_name is not None:
+                with open(output_name, "w") as file:
+                    engines[engine_name](program, output=OUTPUT(file.write))
+                print("exit 0")
+            else:
+                engines[engine_name](program)
+                print("exit 0")
+        elif cmd == "profile":
+            if program is None:
+                print_prog_not_found_str("profile")
             else:
-                interpreter.execute_bytecode()
+                code = get_optimized_code(program) if "optimized" in user_input[1:] else program.get_code()
+                (program_profile, _) = run_profiled(program, code=code)
+                print(profile_report(program_profile, program.get_var_names()))
+                print("exit 0")
+        elif cmd == "sweep":
+            args = [arg for arg in user_input[1:] if arg != ""]
+            output_name = None
+            if ">" in args and args.index(">") == len(args) - 2:
+                output_name = args[-1]
+                args = args[:-2]
+            use_optimized = "optimized" in args
+            if program is None:
+                print_prog_not_found_str("sweep")
+                continue
+            try:
+                ranges = dict(parse_sweep_range(arg) for arg in args if arg != "optimized")
+                inputs = grid_inputs(ranges)
+            except ValueError:
+                print("Usage: sweep name=start:stop[:step] name=v1,v2,... [optimized] [> file]")
+                continue
+            code = get_optimized_code(program) if use_optimized else None
+            start = time.perf_counter()
+            try:
+                if output_name is not None:
+                    with open(output_name, "w") as file:
+                        (values, errors) = run_vectorized(program, inputs, code, OUTPUT(file.write))
+                else:
+                    (values, errors) = run_vectorized(program, inputs, code)
+            except (NameError, ValueError) as e:
+                print(e)
+                continue
+            n = len(next(iter(inputs.values())))
+            print_sweep_summary(values, errors, n, time.perf_counter() - start)
         elif cmd == "render_ast":
-            if interpreter is None:
+            if program is None:
                 print_prog_not_found_str("render_ast")
+            elif program_str is None:
+                print("A program image has no syntax tree")
             else:
+                if program_ast is None:  # the program was loaded from the cache
+                    program_ast = token_str_to_ast(generate_tokens(program_str))
+                    if optimized:
+                        program_ast = optimize_ast(program_ast)
                 render_ast(program_ast, f"{program_name}_ast")
         elif cmd == "print_bseq":
-            if interpreter is None:
+            if program is None:
                 print_prog_not_found_str("print_bseq")
             else:
-                interpreter.print_local_var_table()
-                interpreter.print_bytecode_seq()
-                interpreter.print_label_table()
+                program.print_local_var_table()
+                program.print_bytecode_seq()
+                program.print_label_table()
+                program.print_line_table()
+                print_optimized_code(program)
+        elif cmd == "write_image":
+            if program is None:
+                print_prog_not_found_str("write_image")
+            else:
+                try:
+                    write_image(user_input[1], program)
+                    print(f"Program image '{user_input[1]}' written")
+                except (ValueError, OSError) as e:
+                    print(e)
+        elif cmd == "load" and user_input[1].endswith(".mmji"):
+            try:
+                program = MAPPED_PROGRAM(user_input[1])
+            except (ValueError, OSError) as e:
+                print(e)
+                continue
+            (program_name, program_str, program_ast) = (user_input[1], None, None)
+            print(f"Program image '{program_name}' successfully loaded")
         elif cmd == "load":
             program_name = user_input[1]
             try:
@@ -118,14 +247,30 @@ if __name__ == '__main__':
                 continue
 
             program_str = file.read()
+            optimized = "-O" in user_input[2:]
+            program_ast = None
 
-            token_list = tokenize_program_str(program_str)
+            cached_program = load_program(program_name, program_str, optimized)
+            if cached_program is not None:
+                program = cached_program
+                print(f"Program '{program_name}' successfully loaded")
+                continue
+            try:
+                program_ast = token_str_to_ast(generate_tokens(program_str))
+            except Exception as e:
+                if parse_error.token is None:
+                    print(e)
+                else:
+                    print_parse_error(program_str, parse_error.token)
+                continue
             try:
-                program_ast = token_str_to_ast(token_list)
-            except Exception:
-                print_parse_error(token_list, parse_error.position)
+                if optimized:
+                    program_ast = optimize_ast(program_ast)
+                program = PROGRAM(program_ast)
+            except (NameError, ValueError) as e:
+                print(e)
                 continue
-            interpreter = INTERPRETER(program_ast)
+            store_program(program_name, program_str, program, optimized)
             print(f"Program '{program_name}' successfully loaded")
         else:
             print("Command not found!")
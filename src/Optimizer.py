@@ -0,0 +1,142 @@
+from Interpreter import *
+
+# Peephole optimizer for the linked bytecode
+# - jump threading: jumps to a goto go directly to the target of the goto, gotos to the next instruction are removed
+# - constant folding: iconst a; iconst b; binop -> iconst (a binop b)
+# - redundant load/store elimination: iload x; istore x is removed
+# - superinstructions: common sequences are fused into one instruction (see the opcodes in Interpreter.py)
+# Instructions are only combined if none but the first is a jump target, the jumps are remapped to the new addresses
+
+binop_functions = {IADD: lambda a, b: a + b, ISUB: lambda a, b: a - b, IMUL: lambda a, b: a * b,
+                   IDIV: lambda a, b: int(a / b)}
+
+# Fusions of (the opcodes of the sequence) into a superinstruction, the function gets the instructions of the sequence
+fusions = {
+    (ILOAD, ICONST, IADD, ISTORE): lambda s: (IINC, s[0][1], s[1][1], s[3][1]),
+    (ILOAD, ICONST, ISUB, ISTORE): lambda s: (IINC, s[0][1], -s[1][1], s[3][1]),
+    (ILOAD, ILOAD, IADD, ISTORE): lambda s: (IADD_VV, s[0][1], s[1][1], s[3][1]),
+    (ILOAD, ILOAD, ISUB, ISTORE): lambda s: (ISUB_VV, s[0][1], s[1][1], s[3][1]),
+    (ILOAD, ILOAD, IMUL, ISTORE): lambda s: (IMUL_VV, s[0][1], s[1][1], s[3][1]),
+    (ILOAD, ISTORE): lambda s: (IMOV, s[0][1], s[1][1]),
+    (ICONST, ISTORE): lambda s: (ISET, s[0][1], s[1][1]),
+    (ILOAD, PRINT): lambda s: (PRINT_V, s[0][1]),
+    (ILOAD, ILOAD, ICMPE): lambda s: (ICMPE_VV, s[0][1], s[1][1], s[2][1]),
+    (ILOAD, ICONST, ICMPE): lambda s: (ICMPE_VC, s[0][1], s[1][1], s[2][1]),
+    (ICONST, ILOAD, ICMPE): lambda s: (ICMPE_CV, s[0][1], s[1][1], s[2][1]),
+    (ILOAD, ILOAD, ICMPGE): lambda s: (ICMPGE_VV, s[0][1], s[1][1], s[2][1]),
+    (ILOAD, ICONST, ICMPGE): lambda s: (ICMPGE_VC, s[0][1], s[1][1], s[2][1]),
+    (ICONST, ILOAD, ICMPGE): lambda s: (ICMPGE_CV, s[0][1], s[1][1], s[2][1]),
+}
+# The fusions are tried from the longest to the shortest sequence
+fusion_lengths = sorted({len(seq) for seq in fusions}, reverse=True)
+
+
+# Returns the final target of a jump to addr, following the chain of gotos
+def thread_jump(code, addr):
+    seen = set()
+    while addr < len(code) and code[addr][0] == GOTO and addr not in seen:
+        seen.add(addr)
+        addr = code[addr][1]
+    return addr
+
+
+# Returns the code with the threaded jumps, the gotos to the next instruction are replaced by None
+def thread_jumps(code):
+    threaded = []
+    for (pc, instr) in enumerate(code):
+        if instr[0] in jump_ops:
+            target = thread_jump(code, instr[-1])
+            if instr[0] == GOTO and target == pc + 1:
+                instr = None
+            else:
+                instr = instr[:-1] + (target,)
+        threaded.append(instr)
+    return threaded
+
+
+# Tries to fold the instruction into the tail of out, returns the folded instruction or None
+def fold(out, block_start, instr):
+    op = instr[0]
+    if op in binop_functions and len(out) - block_start >= 2 and out[-1][0] == ICONST and out[-2][0] == ICONST:
+        try:
+            value = binop_functions[op](out[-2][1], out[-1][1])
+        except (ZeroDivisionError, OverflowError):  # the error is raised when the program is executed
+            return None
+        del out[-2:]
+        return ICONST, value
+    return None
+
+
+# Tries to fuse the tail of out into a superinstruction
+def fuse(out, block_start):
+    for length in fusion_lengths:
+        if len(out) - block_start < length:
+            continue
+        seq = out[-length:]
+        fusion = fusions.get(tuple(instr[0] for instr in seq))
+        if fusion is not None:
+            out[-length:] = [fusion(seq)]
+            return
+
+
+# Returns the optimized code and the new address of every address of code
+def optimize_code(code):
+    code = thread_jumps(code)
+    targets = {instr[-1] for instr in code if instr is not None and instr[0] in jump_ops}
+    new_addr = [0] * (len(code) + 1)  # new address of every old address
+    out = []
+    block_start = 0  # instructions before block_start can't be combined with the following ones
+    for (pc, instr) in enumerate(code):
+        if pc in targets:
+            block_start = len(out)
+        new_addr[pc] = len(out)
+        if instr is None:
+            continue
+        if instr[0] == ISTORE and len(out) > block_start and out[-1] == (ILOAD, instr[1]):
+            out.pop()
+            continue
+        folded = fold(out, block_start, instr)
+        out.append(folded if folded is not None else instr)
+        fuse(out, block_start)
+    new_addr[len(code)] = len(out)
+    return [instr[:-1] + (new_addr[instr[-1]],) if instr[0] in jump_ops else instr for instr in out], new_addr
+
+
+# Returns the optimized code
+def optimize(code):
+    return optimize_code(code)[0]
+
+
+# Returns the line table of the optimized code, a combined instruction belongs to the line of its first instruction
+# If the instructions of a line were all removed, the next line starts at the same address and replaces it
+def remap_line_table(line_table, new_addr):
+    remapped = []
+    for (addr, line) in line_table:
+        addr = new_addr[addr]
+        if remapped and remapped[-1][0] == addr:
+            remapped.pop()
+        if not remapped or remapped[-1][1] != line:
+            remapped.append((addr, line))
+    return tuple(remapped)
+
+
+# Returns the optimized code of the program, the code is optimized on the first call
+def get_optimized_code(program):
+    if program.opt_code is None:
+        (opt_code, new_addr) = optimize_code(program.get_code())
+        program.opt_line_table = remap_line_table(program.get_line_table(), new_addr)
+        program.opt_max_stack = max_stack_depth(opt_code, len(program.get_var_names()))  # verifies the optimized code
+        program.opt_code = opt_code
+    return program.opt_code
+
+
+# Executes the optimized code of the program on the stack VM and returns the values of the variables at the end
+def run_optimized(program, values=None, output=None):
+    return program.run(values, get_optimized_code(program), output)
+
+
+def print_optimized_code(program):
+    opt_code = get_optimized_code(program)
+    print(f"Optimized: {len(program.get_code())} -> {len(opt_code)} instructions")
+    for i in range(len(opt_code)):
+        print(disassemble_instr(opt_code, i, program.get_var_names()))
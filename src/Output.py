@@ -0,0 +1,34 @@
+import sys
+
+
+# Output sink of the print instruction
+# The printed values are buffered and written as one block of text when buffer_size values are buffered, when the
+# program ends and when flush is called. write is called with every block: sys.stdout.write by default, the write method
+# of a file or any other callback
+class OUTPUT:
+    def __init__(self, write=None, buffer_size=1024):
+        self.write = sys.stdout.write if write is None else write
+        self.buffer_size = buffer_size  # number of values that are buffered
+        self.values = []
+
+    def print(self, value):
+        self.values.append(value)
+        if len(self.values) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.values:
+            values = self.values
+            self.values = []
+            self.write("".join([f"<print> {value}\n" for value in values]))
+
+
+# Output sink that keeps the output in memory
+class MEMORY_OUTPUT(OUTPUT):
+    def __init__(self, buffer_size=1024):
+        self.blocks = []
+        super().__init__(self.blocks.append, buffer_size)
+
+    def get_value(self):
+        self.flush()
+        return "".join(self.blocks)
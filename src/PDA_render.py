@@ -26,9 +26,9 @@ def render_ast(ast_root, filename):
             g.node(str(node), node.to_string(), shape="box")
         else:
             g.node(str(node), node.to_string(), shape="box", style="filled")
-        W.extend(node.get_children())
-        if node.get_parent() is not None:
-            g.edge(str(node.get_parent()), str(node), None)
+        for child in node.get_children():
+            W.append(child)
+            g.edge(str(node), str(child), None)
     g.view()
 
 
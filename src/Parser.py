@@ -1,14 +1,24 @@
+import gc
+import hashlib
+import os
+import pickle
+from array import array
+from collections import deque
+
 from Lexer import Token
+from Lexer import token_ids
 from SyntaxTree import *
 from PDA_render import render_pda
 from PDA_render import render_ast
 
 # A production has the following structure name: l_symbol -> [r_symbols]
+# action is the semantic action of the production, it gets the values of r_symbols and returns the value of l_symbol
 class Prod_Rule:
-    def __init__(self, name, l_symbol, r_symbols):
+    def __init__(self, name, l_symbol, r_symbols, action=None):
         self.name = name
         self.l_symbol = l_symbol
         self.r_symbols = r_symbols
+        self.action = action
 
     # returns the symbol at pos in r_symbols
     # returns None if the Symbol is out of bounds
@@ -41,30 +51,15 @@ class Prod_Rule:
 
 # A state consists of:
 # - name
-# - Set of productions and the position in the production
+# - Set of items (rule name, position in the production), frozen so that it can be used as a key of a dict
 # - A shift reduce rule, if the State is a reduced state, else the parameter stays None
 class State:
-    def __init__(self, name, prod_pos_set):
+    def __init__(self, name, items, cfg):
         self.name = name
-        self.prod_pos_set = prod_pos_set
+        self.items = items
+        self.prod_pos_set = {(cfg.get_prod(rule), pos) for (rule, pos) in items}  # productions for printing
         self.rule = None
 
-    # Compares 2 states -> States are equal if they have the same production_position_set
-    def cmp_states(self, prod_pos_set2):
-        if len(self.prod_pos_set) != len(prod_pos_set2):  # If the 2 sets have different length they cannot be equal
-            return False
-
-        # Check if for every (production,pos) in the first set, if their exists a (production,pos)' in the second set
-        for pp in self.prod_pos_set:
-            found = False  # Break out of the loop if a corresponding element has been found
-            for pp2 in prod_pos_set2:
-                if pp[0].cmp_prod_rule(pp2[0]) and pp[1] == pp2[1]:  # Compare elements
-                    found = True
-                    break
-            if not found:
-                return False
-        return True
-
     # Returns the name of the state as a str (name is an int)
     def name_str(self):
         return str(self.name)
@@ -73,7 +68,7 @@ class State:
     def to_string(self):
         tmp = ""
         tmp += "State: " + str(self.name) + "\n"
-        for pp in self.prod_pos_set:
+        for pp in sorted(self.prod_pos_set, key=lambda pp: (pp[0].name, pp[1])):
             tmp += pp[0].to_string(pp[1]) + "\n"
         if self.rule is not None:
             tmp += "red: " + str(self.rule.name)
@@ -82,16 +77,6 @@ class State:
     def print(self):
         print(self.to_string())
 
-    # Finds all the productions in prod_pos_set for which sym is equal to the element at the current position
-    # Return these productions and increments pos
-    # Is used in the function create pda to find all the productions for the next state (that can be reached with sym)
-    def next_prod_pos_set(self, sym):
-        tmp = set()
-        for pp in self.prod_pos_set:
-            if pp[0].return_sym(pp[1]) == sym:
-                tmp.add((pp[0], pp[1] + 1))
-        return tmp
-
 
 # Class to encapsulate a Context Free Grammar
 # Is used to create the PDA
@@ -101,13 +86,18 @@ class CFG:
         self.terminals = terminals  # Set of terminals
         self.final = final  # Final non-terminal
         self.productions = productions  # Set of all productions of the grammar
+        self.prod_index = {p.name: p for p in productions}  # productions by name
+        self.prod_list = [self.prod_index.get(name) for name in range(max(self.prod_index.keys()) + 1)]
+        self.l_symbol_index = {}  # productions by their left symbol
+        for p in sorted(productions, key=lambda prod: prod.name):
+            self.l_symbol_index.setdefault(p.l_symbol, []).append(p)
 
     def get_prod(self, name):
-        p = None
-        for p in self.productions:
-            if p.name == name:
-                break
-        return p
+        return self.prod_index.get(name)
+
+    # Returns all productions with l_symbol on the left side
+    def get_prods_of(self, l_symbol):
+        return self.l_symbol_index.get(l_symbol, [])
 
 
 # Class for a Push Down Automata that is used to create the parsing table
@@ -120,73 +110,63 @@ class PDA:
         self.cfg = cfg
 
 
-# Finds all productions in the cfg, for which a (production,position) pair in the set pp exists,
-# where at the current position the symbol is a non-terminal
-def non_term_rule(pp_set, cfg):
-    prod_pos_tmp = set()
-    for prod_pos in pp_set:
-        sym = prod_pos[0].return_sym(prod_pos[1])
+# Adds all items (prod, 0) to the item set for which an item exists, where at the current position the symbol is the
+# non-terminal prod.l_symbol. Every item is only expanded once, so this is linear in the size of the closure
+def closure(items, cfg):
+    result = set(items)
+    work = list(items)
+    while work:
+        (rule, pos) = work.pop()
+        sym = cfg.get_prod(rule).return_sym(pos)
         if sym in cfg.non_terminals:
-            for prod in cfg.productions:
-                if prod.l_symbol == sym:
-                    prod_pos_tmp.add((prod, 0))
-    return prod_pos_tmp
+            for prod in cfg.get_prods_of(sym):
+                if (prod.name, 0) not in result:
+                    result.add((prod.name, 0))
+                    work.append((prod.name, 0))
+    return frozenset(result)
 
 
-def print_prod_pos_set(pp_set):
-    for pp in pp_set:
-        pp[0].print(pp[1])
+# Groups the items by the symbol at their current position and moves the position over that symbol
+# Returns a dict symbol -> item set, that contains the kernels of all states that can be reached from items
+def next_items(items, cfg):
+    kernels = {}
+    for (rule, pos) in items:
+        sym = cfg.get_prod(rule).return_sym(pos)
+        if sym is not None:
+            kernels.setdefault(sym, set()).add((rule, pos + 1))
+    return kernels
 
 
 # Creates the push down automata
 def create_pda(cfg, start_prod):
-    i = 1
-    start_pp_set = {(start_prod, 0)}
-    start_prod_pos_set = start_pp_set.union(non_term_rule(start_pp_set, cfg))
-    q0 = State(i, start_prod_pos_set)  # Create the initial state
-    i += 1
-    W = {q0}  # Initialize the work set
+    q0 = State(1, closure({(start_prod.name, 0)}, cfg), cfg)  # Create the initial state
+    index = {q0.items: q0}  # item set -> state, to find existing states in constant time
+    W = deque([q0])  # Initialize the work list
     Q = set()
     F = set()
     trans = set()
 
-    while W != set():
-        q = W.pop()  # get the next state from
+    while W:
+        q = W.popleft()  # get the next state, breadth first so that the state names are deterministic
         Q.add(q)
-        for sym in cfg.non_terminals.union(cfg.terminals):  # Iterate over symbols
-            if len(q.prod_pos_set) == 1:  # If prod_pos has length == 1 then state might be final
-                pp = q.prod_pos_set.pop()
-                q.prod_pos_set.add(pp)
-                # state is final if the cursor is outside of production and the last symbol is the final symbol
-                if len(pp[0].r_symbols) == pp[1] and pp[0].return_sym(pp[1] - 1) == cfg.final:
-                    F.add(q)
-                    break  # break out of symbol-loop, state is done processing
-            if len(q.prod_pos_set) >= 1:  # If prod_pos has length >= 1 then the state might have a reduction rule
-                pp = q.prod_pos_set.pop()
-                q.prod_pos_set.add(pp)
-                if pp[0].return_sym(pp[1]) is None:  # In some production the cursor is outside -> The symbol has a rule
-                    q.rule = pp[0]
-
-            # Create next set of productions
-            cur_prod_pos_set = q.next_prod_pos_set(sym)
-
-            # Apply non term rule recursive until all reachable productions have been added to cur_prod_pos_set
-            tmp = State(-1, set())
-            while not tmp.cmp_states(cur_prod_pos_set):
-                tmp.prod_pos_set = cur_prod_pos_set
-                cur_prod_pos_set = cur_prod_pos_set.union(non_term_rule(cur_prod_pos_set, cfg))
-
-            if cur_prod_pos_set != set():  # If the set isn't empty create a new transition
-                q_ = None
-                for tmp in W.union(Q):  # Check if state with current prod_pos exists
-                    if tmp.cmp_states(cur_prod_pos_set):
-                        q_ = tmp
-                        break
-                if q_ is None:  # state does not exist -> Add new state
-                    q_ = State(i, cur_prod_pos_set)
-                    i += 1
-                    W.add(q_)
-                trans.add((q, sym, q_))  # Add new transition between the old and the new state
+        complete = sorted(rule for (rule, pos) in q.items if cfg.get_prod(rule).return_sym(pos) is None)
+        if complete:
+            prod = cfg.get_prod(complete[0])
+            # state is final if the cursor is outside of the only production and the last symbol is the final symbol
+            if len(q.items) == 1 and prod.return_sym(len(prod.r_symbols) - 1) == cfg.final:
+                F.add(q)
+                continue  # state is done processing
+            q.rule = prod  # In some production the cursor is outside -> The symbol has a rule
+
+        kernels = next_items(q.items, cfg)
+        for sym in sorted(kernels):  # Create a transition for every symbol that can be read in q
+            items = closure(kernels[sym], cfg)
+            q_ = index.get(items)
+            if q_ is None:  # state does not exist -> Add new state
+                q_ = State(len(index) + 1, items, cfg)
+                index[items] = q_
+                W.append(q_)
+            trans.add((q, sym, q_))  # Add new transition between the old and the new state
     return PDA(q0, Q, F, trans, cfg)
 
 
@@ -235,94 +215,99 @@ def get_t_entry(table, st, a):
     return table[st][a]
 
 
-class Stack:
-    def __init__(self, li):
-        self.list = li.copy()
-        self.list.reverse()
-
-    def stack_len(self):
-        return len(self.list)
-
-    def print(self):
-        stri = ""
-        for elem in self.list:
-            stri += elem.to_string()
-        return stri
-
-    def to_string(self):
-        return self.list
-
-    def push(self, elem):
-        self.list.append(elem)
-
-    def set_last(self, elem):
-        self.list[len(self.list) - 1] = elem
+# Entry types of the dense parsing table, an entry is (state p or rule name) << 2 | type
+# Goto entries are never 0 as the state names start at 1, so 0 marks an error
+GOTO = 0
+SHIFT = 1
+REDUCE = 2
+ACCEPT = 3
+ERROR = 0
 
-    def pop(self):
-        return self.list.pop()
 
-    def peek(self):
-        return self.list[len(self.list) - 1]
+# The parsing table with all symbols and productions encoded as small integers
+# - symbol_ids: terminals have the ids of the lexer (token_ids), the non-terminals follow
+# - entries: flat array, the entry of state q and symbol a is at q * n_symbols + symbol_ids[a]
+# - prod_len, prod_lhs: length and id of the left symbol of the productions indexed by the rule name
+class Parse_Table:
+    def __init__(self, table, cfg):
+        self.symbol_ids = dict(token_ids)
+        for sym in sorted(cfg.terminals) + sorted(cfg.non_terminals):
+            self.symbol_ids.setdefault(sym, len(self.symbol_ids))
+        self.n_symbols = len(self.symbol_ids)
+        self.entries = array("i", [ERROR]) * ((max(table.keys()) + 1) * self.n_symbols)
+        for q in table.keys():
+            for a in table[q].keys():
+                (ptype, p) = table[q][a]
+                self.entries[q * self.n_symbols + self.symbol_ids[a]] = (max(p, 0) << 2) | ptype
 
-    def empty(self):
-        return len(self.list) == 0
+        self.prod_len = [len(p.r_symbols) if p is not None else 0 for p in cfg.prod_list]
+        self.prod_lhs = [self.symbol_ids[p.l_symbol] if p is not None else -1 for p in cfg.prod_list]
 
 
 class Parse_Error:
     position = None
+    token = None
 
 
 parse_error = Parse_Error
 
 
-# Returns the root node of the AST tree of word
-def parse_word(table, word, cfg):
-    state_stack = Stack([1])
-    # Stack consists of AST nodes
-    symbol_stack = Stack([])
-    # Stack consists of Tokens
-    word_stack = Stack(word)
-
-    token_str_len = word_stack.stack_len()
-
-    while not word_stack.empty() or not symbol_stack.empty():
-        parse_error.position = token_str_len - word_stack.stack_len()
-        # print(state_stack.to_string())
-        # print(symbol_stack.print(), end=" // ")
-        # print(word_stack.print())
-        # print("------------------")
-
-        if state_stack.peek() is None:
-            state_stack.pop()
-            (ptype, st) = get_t_entry(table, state_stack.peek(), symbol_stack.peek().get_ttype())
-        else:
-            (ptype, st) = get_t_entry(table, state_stack.peek(), word_stack.peek().get_ttype())
-
-        if ptype == 0:
-            state_stack.push(st)
-        elif ptype == 1:  # shift
-            s = word_stack.pop()
-            new_node = AST_NODE(s)
-            symbol_stack.push(new_node)
-            state_stack.push(st)
-        elif ptype == 2:  # reduce
-            p = cfg.get_prod(st)
-            new_node = AST_NODE(Token(p.l_symbol, p.l_symbol))  # create new parent node
-            for i in range(len(p.r_symbols)):  # add child nodes to the new parent node
-                child_node = symbol_stack.pop()
-                child_node.set_parent(new_node)
-                new_node.add_child(child_node)
-                state_stack.pop()
-            symbol_stack.push(new_node)
-            state_stack.push(None)
-        elif ptype == 3:  # final
+# Returns the root node of the AST tree of word, table is a Parse_Table
+# word can be any iterable of tokens (e.g. the generator of the lexer), it is consumed with one token lookahead
+# parse_error.position is the number of consumed tokens, so on an error it is the position of the lookahead
+# parse_error.token is the lookahead on an error, its line and column are the position of the error in the program
+# If semantic is True the actions of the productions build the simplified ast during the reductions,
+# else the concrete syntax tree with a node for every symbol is returned (which simplify_ast can simplify)
+def parse_word(table, word, cfg, semantic=True):
+    entries = table.entries
+    n_symbols = table.n_symbols
+    prods = cfg.prod_list
+    state_stack = [1]
+    # Stack consists of the values of the symbols (Tokens and semantic values or AST nodes)
+    symbol_stack = []
+    # Iterator over the Tokens
+    word_iter = iter(word)
+    lookahead = next(word_iter, None)
+    parse_error.position = 0
+    parse_error.token = None
+
+    while lookahead is not None:
+        entry = entries[state_stack[-1] * n_symbols + lookahead.tid]
+        ptype = entry & 3
+
+        if entry == ERROR:
+            parse_error.token = lookahead
+            raise SyntaxError(f"Unexpected token {lookahead.to_string()} at line {lookahead.line}, "
+                              f"column {lookahead.col}")
+        elif ptype == SHIFT:
+            symbol_stack.append(lookahead if semantic else AST_NODE(lookahead))
+            state_stack.append(entry >> 2)
+            lookahead = next(word_iter, None)
+            parse_error.position += 1
+        elif ptype == REDUCE:
+            rule = entry >> 2
+            r_len = table.prod_len[rule]
+            if semantic:
+                values = symbol_stack[-r_len:]
+                del symbol_stack[-r_len:]
+                symbol_stack.append(prods[rule].action(values))
+            else:
+                p = prods[rule]
+                new_node = AST_NODE(Token(p.l_symbol, p.l_symbol))  # create new parent node
+                for i in range(r_len):  # add child nodes to the new parent node
+                    new_node.add_child(symbol_stack.pop())
+                symbol_stack.append(new_node)
+            del state_stack[-r_len:]
+            # goto entry of the state below the reduced production
+            state_stack.append(entries[state_stack[-1] * n_symbols + table.prod_lhs[rule]] >> 2)
+        elif ptype == ACCEPT:  # final
+            if semantic:
+                return prog_action(symbol_stack)
             root = AST_NODE(Token("PROG", "PROG"))  # Add the Prog root node
-            while not symbol_stack.empty():
-                child_node = symbol_stack.pop()
-                child_node.set_parent(root)
-                root.add_child(child_node)
+            while symbol_stack:
+                root.add_child(symbol_stack.pop())
             return root
-    return None
+    raise SyntaxError("Unexpected end of the program")
 
 
 term = {"plus", "minus", "mul", "div", "name", "d_equal", "greater_equal", "number"}
@@ -354,7 +339,7 @@ def simplify_ast(ast_node):
         return local_root
 
     for i, child in enumerate(children_rev):
-        if child.get_ttype() == "name" and child.get_parent().get_ttype() == "STMT":
+        if child.get_ttype() == "name" and ast_node.get_ttype() == "STMT":
             local_root = AST_NODE(Token("assign", "assign"))
             expr = simplify_ast(children_rev[i + 2])
             name = simplify_ast(child)
@@ -398,9 +383,7 @@ def simplify_ast(ast_node):
             return child
         if child.get_ttype() in non_term:
             ast_node.set_token(Token("block", "block"))
-            new_child = simplify_ast(child)
-            new_child.set_parent(ast_node)
-            ast_node.replace_child(child, new_child)
+            ast_node.replace_child(child, simplify_ast(child))
         if child.get_value() in remove_symbol:
             ast_node.remove_child(child)
         if child.get_ttype() == "DECL":
@@ -409,35 +392,116 @@ def simplify_ast(ast_node):
     return ast_node
 
 
+# Semantic actions, they build the simplified ast during the reductions (see simplify_ast for the structure)
+# The values of BINOP and COMP are their Tokens, EXPR and COND are ast nodes
+# The value of STMT is a pair (node, STMT children): if and if else statements splice the simplified STMT children
+# of their bodies into their own children (what find_alternatives does on the concrete tree)
+# Tokens are never modified, so all nodes of the same kind share one Token
+decl_token = Token("decl", "decl")
+block_token = Token("block", "block")
+assign_token = Token("assign", "assign")
+print_token = Token("print", "print")
+while_token = Token("while", "while")
+if_token = Token("if", "if")
+else_token = Token("else", "else")
+
+
+# Returns the span from the start of first to the end of last, first and last are tokens or nodes
+def join_spans(first, last):
+    (line, col, _, _) = first.get_span()
+    (_, _, end_line, end_col) = last.get_span()
+    return line, col, end_line, end_col
+
+
+def token_action(values):  # BINOP, COMP
+    return values[0]
+
+
+def leaf_action(values):  # EXPR -> number | name
+    return AST_NODE(values[0])
+
+
+def inner_action(values):  # EXPR, COND -> ( X )
+    return values[1]
+
+
+def binop_action(values):  # EXPR -> EXPR BINOP EXPR, COND -> EXPR COMP EXPR
+    return AST_NODE(values[1], [values[2], values[0]], join_spans(values[0], values[2]))
+
+
+def decl_action(values):  # DECL -> name , DECL | name ;
+    if len(values) == 3:
+        return AST_NODE(decl_token, [values[2], AST_NODE(values[0])])
+    return AST_NODE(decl_token, [AST_NODE(values[0])])
+
+
+def block_action(values):  # STMT -> STMT STMT
+    return AST_NODE(block_token, [values[1][0], values[0][0]], join_spans(values[0][0], values[1][0])), \
+        [values[0][0], values[1][0]]
+
+
+def brace_action(values):  # STMT -> { STMT }
+    return AST_NODE(block_token, [values[1][0]], join_spans(values[0], values[2])), [values[1][0]]
+
+
+def assign_action(values):
+    return AST_NODE(assign_token, [values[2], AST_NODE(values[0])], join_spans(values[0], values[3])), []
+
+
+def print_action(values):
+    return AST_NODE(print_token, [values[2]], join_spans(values[0], values[4])), []
+
+
+def while_action(values):
+    return AST_NODE(while_token, [values[4][0], values[2]], join_spans(values[0], values[4][0])), [values[4][0]]
+
+
+def if_action(values):
+    alternative_list = list(reversed(values[4][1]))
+    alternative_list.append(values[2])
+    return AST_NODE(if_token, alternative_list, join_spans(values[0], values[4][0])), [values[4][0]]
+
+
+def if_else_action(values):
+    else_node = AST_NODE(else_token, list(reversed(values[6][1])))
+    return AST_NODE(if_token, [else_node, values[4][0], values[2]], join_spans(values[0], values[6][0])), \
+        [values[4][0], values[6][0]]
+
+
+# PROG -> DECL STMT $, called when the parser accepts (before "$" is shifted)
+def prog_action(values):
+    return AST_NODE(block_token, [values[1][0], values[0]])
+
+
 r0 = Prod_Rule(0, "PROG", ["DECL", "STMT", "$"])
 
-r1 = Prod_Rule(1, "BINOP", ["plus"])
-r2 = Prod_Rule(2, "BINOP", ["minus"])
-r3 = Prod_Rule(3, "BINOP", ["div"])
-r4 = Prod_Rule(4, "BINOP", ["mul"])
+r1 = Prod_Rule(1, "BINOP", ["plus"], token_action)
+r2 = Prod_Rule(2, "BINOP", ["minus"], token_action)
+r3 = Prod_Rule(3, "BINOP", ["div"], token_action)
+r4 = Prod_Rule(4, "BINOP", ["mul"], token_action)
 
-r5 = Prod_Rule(5, "DECL", ["name", "comma", "DECL"])
-r6 = Prod_Rule(6, "DECL", ["name", "semicolon"])
+r5 = Prod_Rule(5, "DECL", ["name", "comma", "DECL"], decl_action)
+r6 = Prod_Rule(6, "DECL", ["name", "semicolon"], decl_action)
 
-r7 = Prod_Rule(7, "EXPR", ["number"])
-r8 = Prod_Rule(8, "EXPR", ["name"])
-r9 = Prod_Rule(9, "EXPR", ["EXPR", "BINOP", "EXPR"])
-r10 = Prod_Rule(10, "EXPR", ["lparen", "EXPR", "rparen"])
+r7 = Prod_Rule(7, "EXPR", ["number"], leaf_action)
+r8 = Prod_Rule(8, "EXPR", ["name"], leaf_action)
+r9 = Prod_Rule(9, "EXPR", ["EXPR", "BINOP", "EXPR"], binop_action)
+r10 = Prod_Rule(10, "EXPR", ["lparen", "EXPR", "rparen"], inner_action)
 
-r11 = Prod_Rule(11, "STMT", ["STMT", "STMT"])
-r12 = Prod_Rule(12, "STMT", ["name", "equal", "EXPR", "semicolon"])
-r13 = Prod_Rule(13, "STMT", ["print", "lparen", "EXPR", "rparen", "semicolon"])
+r11 = Prod_Rule(11, "STMT", ["STMT", "STMT"], block_action)
+r12 = Prod_Rule(12, "STMT", ["name", "equal", "EXPR", "semicolon"], assign_action)
+r13 = Prod_Rule(13, "STMT", ["print", "lparen", "EXPR", "rparen", "semicolon"], print_action)
 
-r14 = Prod_Rule(14, "STMT", ["while", "lparen", "COND", "rparen", "STMT"])
-r15 = Prod_Rule(15, "STMT", ["if", "lparen", "COND", "rparen", "STMT"])
-r16 = Prod_Rule(16, "STMT", ["if", "lparen", "COND", "rparen", "STMT", "else", "STMT"])
-r17 = Prod_Rule(17, "STMT", ["lbrace", "STMT", "rbrace"])
+r14 = Prod_Rule(14, "STMT", ["while", "lparen", "COND", "rparen", "STMT"], while_action)
+r15 = Prod_Rule(15, "STMT", ["if", "lparen", "COND", "rparen", "STMT"], if_action)
+r16 = Prod_Rule(16, "STMT", ["if", "lparen", "COND", "rparen", "STMT", "else", "STMT"], if_else_action)
+r17 = Prod_Rule(17, "STMT", ["lbrace", "STMT", "rbrace"], brace_action)
 
-r18 = Prod_Rule(18, "COND", ["lparen", "COND", "rparen"])
-r19 = Prod_Rule(19, "COND", ["EXPR", "COMP", "EXPR"])
+r18 = Prod_Rule(18, "COND", ["lparen", "COND", "rparen"], inner_action)
+r19 = Prod_Rule(19, "COND", ["EXPR", "COMP", "EXPR"], binop_action)
 
-r20 = Prod_Rule(20, "COMP", ["d_equal"])
-r21 = Prod_Rule(21, "COMP", ["greater_equal"])
+r20 = Prod_Rule(20, "COMP", ["d_equal"], token_action)
+r21 = Prod_Rule(21, "COMP", ["greater_equal"], token_action)
 
 cfg = CFG({"PROG", "BINOP", "DECL", "STMT", "EXPR", "REC_DECL", "COND", "COMP"},
           {"number", "semicolon", "plus", "minus", "div", "mul", "$", "print", "while",
@@ -447,10 +511,74 @@ cfg = CFG({"PROG", "BINOP", "DECL", "STMT", "EXPR", "REC_DECL", "COND", "COMP"},
           {r0, r1, r2, r3, r4, r5, r6, r7, r8, r9, r10, r11, r12, r13, r14, r15, r16, r17, r18, r19, r20, r21})
 
 
+# The parsing table is cached on disk next to the sources (like the .pyc files), the file name contains a fingerprint
+# of the grammar so that a changed cfg never picks up an outdated table
+table_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+table_format = 3  # increment if the layout of the parsing table changes
+parse_table = None  # parsing table of the current process, built on first use
+
+
+# Creates a fingerprint out of all productions, symbols and the table format of the cfg and the token ids of the lexer,
+# which the table stores for the terminals
+def cfg_fingerprint(cfg):
+    h = hashlib.sha256()
+    h.update(str(table_format).encode())
+    for p in sorted(cfg.productions, key=lambda prod: prod.name):
+        h.update(repr((p.name, p.l_symbol, p.r_symbols)).encode())
+    h.update(repr((sorted(cfg.non_terminals), sorted(cfg.terminals), cfg.final)).encode())
+    h.update(repr(sorted(token_ids.items())).encode())
+    return h.hexdigest()[:16]
+
+
+def table_cache_path(cfg):
+    return os.path.join(table_cache_dir, f"parse_table.{cfg_fingerprint(cfg)}.pickle")
+
+
+# Loads the parsing table of the cfg from the disk cache, returns None if there is no (valid) cached table
+def load_parsing_table(cfg):
+    try:
+        with open(table_cache_path(cfg), "rb") as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+
+
+# Writes the parsing table to the disk cache, a failed write only means the table is rebuilt next time
+def store_parsing_table(cfg, table):
+    path = table_cache_path(cfg)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(table_cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as file:
+            pickle.dump(table, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # atomic, concurrent processes never see a half written table
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Returns the parsing table of the cfg, the table is only built once per process and reused across processes
+# through the disk cache as long as the grammar does not change
+def get_parsing_table():
+    global parse_table
+    if parse_table is None:
+        table = load_parsing_table(cfg)
+        if table is None:
+            table = Parse_Table(create_parsing_table(create_pda(cfg, r0)), cfg)
+            store_parsing_table(cfg, table)
+        parse_table = table
+    return parse_table
+
+
+# The garbage collector is paused while parsing: the parser allocates a node for almost every token, which triggers
+# collections that walk the whole (growing) tree again and again, and the tree has no reference cycles anyway
 def token_str_to_ast(token_str):
-    pda = create_pda(cfg, r0)
-    table = create_parsing_table(pda)
-    # render_pda(pda, "pda")
-    ast = parse_word(table, token_str, cfg)
-    ast = simplify_ast(ast)
-    return ast
+    table = get_parsing_table()
+    # render_pda(create_pda(cfg, r0), "pda")
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return parse_word(table, token_str, cfg)
+    finally:
+        if gc_enabled:
+            gc.enable()
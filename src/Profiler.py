@@ -0,0 +1,107 @@
+import time
+
+from Interpreter import *
+
+# Profiler for the stack VM
+# A profiled run executes the instructions with its own loop, so the normal dispatch loop (FRAME.execute) doesn't pay
+# anything for the profiler. For every address the executions and the time are counted, the jumps backwards are the
+# back edges of the loops, their counts are the iterations of the loops
+
+# The counts of a profiled run of code, the times are in nanoseconds
+# line_table is the line table of code (see Interpreter.line_of), empty if the source lines are unknown
+class PROFILE:
+    def __init__(self, code, line_table=()):
+        self.code = code
+        self.line_table = line_table
+        self.counts = [0] * len(code)  # executions per address
+        self.times = [0] * len(code)  # time per address
+        self.back_edges = {}  # (address of the jump, target) -> number of jumps
+        self.seconds = 0
+
+    def get_opcode_counts(self):
+        counts = {}
+        for (pc, instr) in enumerate(self.code):
+            (count, ns) = counts.get(instr[0], (0, 0))
+            counts[instr[0]] = (count + self.counts[pc], ns + self.times[pc])
+        return counts
+
+    # Returns the counts and times per source line: line -> (count, time)
+    def get_line_counts(self):
+        counts = {}
+        for pc in range(len(self.code)):
+            line = line_of(self.line_table, pc)
+            if line is not None:
+                (count, ns) = counts.get(line, (0, 0))
+                counts[line] = (count + self.counts[pc], ns + self.times[pc])
+        return counts
+
+    # Returns the loops as tuples (iterations, first address, last address), the most iterations first
+    def get_hot_loops(self):
+        return sorted(((count, target, pc) for ((pc, target), count) in self.back_edges.items()), reverse=True)
+
+
+# Returns the line table of code, the linked or the optimized code of the program
+def code_line_table(program, code):
+    if code is program.get_code():
+        return program.get_line_table()
+    if code is program.opt_code:
+        return program.opt_line_table
+    return ()
+
+
+# Executes the program on the stack VM with profiling, returns the profile and the values of the variables at the end
+# The arguments are the ones of PROGRAM.run
+def run_profiled(program, values=None, code=None, output=None):
+    frame = FRAME(program, values, code, output)
+    code = frame.code
+    profile = PROFILE(code, code_line_table(program, code))
+    (counts, times, back_edges) = (profile.counts, profile.times, profile.back_edges)
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    try:
+        while frame.p_ctr < len(code):
+            pc = frame.p_ctr
+            cmd = code[pc]
+            op = cmd[0]
+            t = clock()
+            handlers[op](frame, cmd)
+            times[pc] += clock() - t
+            counts[pc] += 1
+            if op not in jump_ops:
+                frame.p_ctr = pc + 1
+            elif frame.p_ctr <= pc:
+                back_edges[(pc, frame.p_ctr)] = back_edges.get((pc, frame.p_ctr), 0) + 1
+    finally:
+        frame.output.flush()
+        profile.seconds = time.perf_counter() - start
+    return profile, frame.get_values()
+
+
+# Returns the report of the profile: the opcodes, the hottest loops and the disassembly with the counts and times
+def profile_report(profile, var_names, loops=5):
+    total_count = sum(profile.counts)
+    total_time = sum(profile.times) or 1
+    lines = [f"Profile: {total_count} instructions executed in {profile.seconds:.6f}s", "",
+             f"{'opcode':<12}{'count':>12}{'time (ms)':>12}{'time %':>8}"]
+    opcode_counts = sorted(profile.get_opcode_counts().items(), key=lambda item: item[1][1], reverse=True)
+    for (op, (count, ns)) in opcode_counts:
+        lines.append(f"{opcode_names[op]:<12}{count:>12}{ns / 1e6:>12.3f}{100 * ns / total_time:>7.1f}%")
+    line_counts = profile.get_line_counts()
+    if line_counts:
+        lines += ["", f"{'line':<12}{'count':>12}{'time (ms)':>12}{'time %':>8}"]
+        for (line, (count, ns)) in sorted(line_counts.items()):
+            lines.append(f"{line:<12}{count:>12}{ns / 1e6:>12.3f}{100 * ns / total_time:>7.1f}%")
+    lines += ["", "Hot loops:"]
+    for (iterations, first, last) in profile.get_hot_loops()[:loops]:
+        ns = sum(profile.times[first:last + 1])
+        count = sum(profile.counts[first:last + 1])
+        source_lines = {line_of(profile.line_table, pc) for pc in range(first, last + 1)} - {None}
+        source = f" (lines {min(source_lines)}-{max(source_lines)})" if source_lines else ""
+        lines.append(f"loop {first}-{last}{source}: {iterations} iterations, {count} instructions, {ns / 1e6:.3f} ms "
+                     f"({100 * ns / total_time:.1f}%)")
+    lines += ["", f"{'line':>6}{'count':>12}{'time (ms)':>12}  instruction"]
+    for pc in range(len(profile.code)):
+        line = line_of(profile.line_table, pc)
+        lines.append(f"{'' if line is None else line:>6}{profile.counts[pc]:>12}{profile.times[pc] / 1e6:>12.3f}  "
+                     f"{disassemble_instr(profile.code, pc, var_names)}")
+    return "\n".join(lines)
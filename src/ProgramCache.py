@@ -0,0 +1,158 @@
+import hashlib
+import os
+
+from Lexer import generate_tokens
+from Parser import token_str_to_ast
+from AstOptimizer import optimize_ast
+from Interpreter import PROGRAM
+from Interpreter import operand_kinds
+
+# Disk cache for compiled programs, like the .pyc files of Python
+# The compiled program of a source file is stored in __pycache__/<file name>.mmjc next to the file (.opt.mmjc for
+# programs with an optimized syntax tree). A cached program is only used if the source hash and the format match,
+# otherwise the program is compiled again and the cache is overwritten
+# Layout: magic, format (1 byte), sha256 of the source (32 bytes), the variable names, the label table, the code and
+# the line table
+# All integers are zigzag encoded varints, as the constants of a program can be arbitrary large or negative
+# Instructions are the opcode (1 byte) followed by its operands, the number of operands is given by operand_kinds
+
+cache_magic = b"MMJC"
+cache_format = 5  # increment if the layout of the file or the code generation changes
+
+
+def cache_path(source_path, optimized):
+    (directory, name) = os.path.split(os.path.abspath(source_path))
+    suffix = ".opt.mmjc" if optimized else ".mmjc"
+    return os.path.join(directory, "__pycache__", name + suffix)
+
+
+def source_hash(program_str):
+    return hashlib.sha256(program_str.encode()).digest()
+
+
+def write_int(out, n):
+    n = n << 1 if n >= 0 else ((-n) << 1) - 1
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+# Returns the integer at pos and the position after it
+def read_int(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    return (n >> 1 if n & 1 == 0 else -((n + 1) >> 1)), pos
+
+
+def serialize_program(program, program_str):
+    out = bytearray(cache_magic)
+    out.append(cache_format)
+    out += source_hash(program_str)
+    write_int(out, len(program.var_names))
+    for name in program.var_names:
+        encoded = name.encode()
+        write_int(out, len(encoded))
+        out += encoded
+    write_int(out, len(program.label_table))
+    for addr in program.label_table:
+        write_int(out, addr)
+    write_int(out, len(program.code))
+    for instr in program.code:
+        out.append(instr[0])
+        for arg in instr[1:]:
+            write_int(out, arg)
+    write_int(out, len(program.line_table))
+    for (addr, line) in program.line_table:
+        write_int(out, addr)
+        write_int(out, line)
+    return bytes(out)
+
+
+# Returns the program of data, or None if data was not created from program_str with the current format
+def deserialize_program(data, program_str):
+    header_len = len(cache_magic) + 1
+    if data[:len(cache_magic)] != cache_magic or data[len(cache_magic)] != cache_format:
+        return None
+    if data[header_len:header_len + 32] != source_hash(program_str):
+        return None
+    pos = header_len + 32
+    (count, pos) = read_int(data, pos)
+    var_names = []
+    for _ in range(count):
+        (length, pos) = read_int(data, pos)
+        var_names.append(data[pos:pos + length].decode())
+        pos += length
+    (count, pos) = read_int(data, pos)
+    label_table = []
+    for _ in range(count):
+        (addr, pos) = read_int(data, pos)
+        label_table.append(addr)
+    (count, pos) = read_int(data, pos)
+    code = []
+    for _ in range(count):
+        op = data[pos]
+        pos += 1
+        instr = [op]
+        for _ in operand_kinds[op]:
+            (arg, pos) = read_int(data, pos)
+            instr.append(arg)
+        code.append(tuple(instr))
+    (count, pos) = read_int(data, pos)
+    line_table = []
+    for _ in range(count):
+        (addr, pos) = read_int(data, pos)
+        (line, pos) = read_int(data, pos)
+        line_table.append((addr, line))
+    if pos != len(data):
+        return None
+    return PROGRAM(linked=(tuple(var_names), tuple(label_table), tuple(code), tuple(line_table)))
+
+
+# Loads the compiled program of the source file from the cache, returns None if there is no (fresh) cached program
+def load_program(source_path, program_str, optimized=False):
+    try:
+        with open(cache_path(source_path, optimized), "rb") as file:
+            return deserialize_program(file.read(), program_str)
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# Writes the compiled program to the cache, a failed write only means the program is compiled again next time
+def store_program(source_path, program_str, program, optimized=False):
+    path = cache_path(source_path, optimized)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as file:
+            file.write(serialize_program(program, program_str))
+        os.replace(tmp_path, path)  # atomic, concurrent processes never see a half written program
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Compiles the program, with an optimized syntax tree if optimized is True
+# Raises a SyntaxError or NameError if the program can't be compiled
+def compile_program(program_str, optimized=False):
+    program_ast = token_str_to_ast(generate_tokens(program_str))
+    if optimized:
+        program_ast = optimize_ast(program_ast)
+    return PROGRAM(program_ast)
+
+
+# Returns the compiled program of the source file, from the cache if it is fresh, otherwise the program is compiled
+# and stored in the cache. Raises a SyntaxError or NameError if the program can't be compiled
+def get_program(source_path, program_str, optimized=False):
+    program = load_program(source_path, program_str, optimized)
+    if program is None:
+        program = compile_program(program_str, optimized)
+        store_program(source_path, program_str, program, optimized)
+    return program
@@ -0,0 +1,108 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from Interpreter import PROGRAM
+from Interpreter import FRAME
+from Interpreter import max_stack_depth
+from Interpreter import operand_kinds
+from Interpreter import record_width
+
+# Program images: the linked code as fixed width records that the VM executes directly from a memory mapped file
+# Every instruction is a record of record_width int64 (opcode, operands..., the unused operands are 0), so the code
+# doesn't have to be deserialized and all processes that map the same image share one copy in the page cache
+# Layout: header (image_header), the variable names separated by newlines, padding to 8 bytes, the line table (pairs of
+# int64 address and line), the records
+# The records are stored in the byte order of the machine that wrote the image, the byte order is part of the header
+
+image_magic = b"MMJI"
+image_format = 3  # increment if the layout of the file or the code generation changes
+# magic, format, big endian, record count, variable count, names length, line table length, maximal stack depth
+image_header = struct.Struct("<4sBBxxIIIII")
+byte_orders = {"little": 0, "big": 1}
+int64_range = range(-2 ** 63, 2 ** 63)
+
+
+# Writes the image of the program to path, raises a ValueError if a constant doesn't fit into an int64
+def write_image(path, program):
+    code = program.get_code()
+    records = array("q", bytes(8 * record_width * len(code)))
+    for (i, instr) in enumerate(code):
+        for (j, value) in enumerate(instr):
+            if value not in int64_range:
+                raise ValueError(f"The constant {value} at address {i} doesn't fit into a record")
+            records[i * record_width + j] = value
+    lines = array("q", [n for pair in program.get_line_table() for n in pair])
+    names = "\n".join(program.get_var_names()).encode()
+    header = image_header.pack(image_magic, image_format, byte_orders[sys.byteorder], len(code),
+                               len(program.get_var_names()), len(names), len(program.get_line_table()),
+                               program.get_max_stack(code))
+    padding = bytes(-(len(header) + len(names)) % 8)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(header + names + padding)
+            lines.tofile(file)
+            records.tofile(file)
+        os.replace(tmp_path, path)  # atomic, processes that map the old image keep their mapping
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# A program that is executed from the memory mapped image at path
+# The stack VM reads the records directly, the tuples of get_code are only created for the other engines
+# The code is verified in place on the records when the image is loaded, a damaged image whose records or maximal stack
+# depth don't match is rejected with a ValueError instead of failing in the VM
+class MAPPED_PROGRAM(PROGRAM):
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, fmt, byte_order, count, var_count, names_len, line_count, max_stack) = \
+                image_header.unpack_from(self.mmap)
+        except struct.error:
+            raise ValueError(f"'{path}' is not a program image")
+        if magic != image_magic or fmt != image_format or byte_order != byte_orders[sys.byteorder]:
+            raise ValueError(f"'{path}' is not a program image of this version and machine")
+        names = self.mmap[image_header.size:image_header.size + names_len].decode()
+        var_names = tuple(names.split("\n")) if var_count else ()
+        offset = image_header.size + names_len
+        offset += -offset % 8
+        if len(var_names) != var_count or offset + 16 * line_count + 8 * record_width * count != len(self.mmap):
+            raise ValueError(f"'{path}' is a damaged program image")
+        lines = memoryview(self.mmap)[offset:offset + 16 * line_count].cast("q")
+        line_table = tuple(zip(lines[0::2], lines[1::2]))
+        lines.release()
+        super().__init__(linked=(var_names, (), (), line_table))
+        self.records = memoryview(self.mmap)[offset + 16 * line_count:].cast("q")
+        self.code = None  # created by get_code
+        try:
+            self.max_stack = max_stack_depth(self.records, var_count, record_width)
+        except ValueError:
+            self.max_stack = None
+        if self.max_stack != max_stack:
+            raise ValueError(f"'{path}' is a damaged program image")
+
+    def get_code(self):
+        if self.code is None:
+            r = self.records
+            self.code = tuple(tuple(r[i:i + 1 + len(operand_kinds[r[i]])]) for i in range(0, len(r), record_width))
+        return self.code
+
+    def get_max_stack(self, code):
+        if code is self.records:
+            return self.max_stack
+        return super().get_max_stack(code)
+
+    def run(self, values=None, code=None, output=None):
+        if code is not None:
+            return super().run(values, code, output)
+        frame = FRAME(self, values, self.records, output)
+        try:
+            frame.execute_records()
+        finally:
+            frame.output.flush()
+        return frame.get_values()
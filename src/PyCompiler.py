@@ -0,0 +1,137 @@
+from Interpreter import *
+from Output import OUTPUT
+
+# Compiler from the linked bytecode to Python
+# The code generator emits while loops and if statements in fixed patterns, so the control flow of the bytecode can be
+# turned back into structured Python code: the variables become locals of a function (with the prefix v_, so that they
+# can't collide with Python names), the loops become native while loops and the function is compiled once with
+# compile(). The patterns are:
+# - while: L: cond; cmp end; body; goto L; end:
+# - if:    cond; cmp end; body; end:
+# - else:  cond; cmp else; body; goto end; else: else_body; end:
+
+binop_formats = {IADD: "({} + {})", ISUB: "({} - {})", IMUL: "({} * {})", IDIV: "int({} / {})"}
+
+# Conditions under which the compare instructions do not jump, the left operand is pushed first
+cmp_formats = {ICMPE: "{} == {}", ICMPGE: "{} >= {}"}
+
+
+# Returns the python name of the variable in slot
+def py_name(var_names, slot):
+    return "v_" + var_names[slot]
+
+
+# Pops the operands of the instruction at pc, an item is a tuple (source, address of the first instruction)
+def pop_operands(items, count, pc):
+    if len(items) < count or any(source is None for (source, start) in items[-count:]):
+        raise ValueError(f"Operands of the instruction at address {pc} are not computed in the same block")
+    operands = items[-count:]
+    del items[-count:]
+    return operands
+
+
+# Adds the items that stay on the stack as expression statements, so they are evaluated in the order of the bytecode
+# Loads of variables and constants are dropped, they can't fail
+def flush_operands(items, lines, indent):
+    for (i, (source, start)) in enumerate(items):
+        if source is not None and source.endswith(")"):
+            lines.append(indent + source)
+        items[i] = (None, start)
+
+
+# Translates code[start:end] into lines of python code with the indentation indent
+def translate_range(code, start, end, var_names, lines, indent):
+    items = []
+    first_line = len(lines)
+    pc = start
+    while pc < end:
+        instr = code[pc]
+        op = instr[0]
+        if op == ILOAD:
+            items.append((py_name(var_names, instr[1]), pc))
+        elif op == ICONST:
+            items.append((str(instr[1]), pc))
+        elif op == ISTORE:
+            (value,) = pop_operands(items, 1, pc)
+            flush_operands(items, lines, indent)
+            lines.append(f"{indent}{py_name(var_names, instr[1])} = {value[0]}")
+        elif op == PRINT:
+            (value,) = pop_operands(items, 1, pc)
+            flush_operands(items, lines, indent)
+            lines.append(f"{indent}emit({value[0]})")
+        elif op == ICMPE or op == ICMPGE:
+            (left, right) = pop_operands(items, 2, pc)
+            flush_operands(items, lines, indent)
+            pc = translate_cmp(code, pc, end, left, right, var_names, lines, indent)
+            continue
+        elif op == GOTO:
+            raise ValueError(f"Unexpected goto at address {pc}")
+        else:
+            (left, right) = pop_operands(items, 2, pc)
+            items.append((binop_formats[op].format(left[0], right[0]), left[1]))
+        pc = pc + 1
+    flush_operands(items, lines, indent)
+    if len(lines) == first_line:
+        lines.append(indent + "pass")
+
+
+# Translates the while loop or if statement of the compare instruction at pc
+# Returns the address of the first instruction after the statement
+def translate_cmp(code, pc, end, left, right, var_names, lines, indent):
+    target = code[pc][1]
+    if target <= pc or target > end:
+        raise ValueError(f"Unexpected jump target at address {pc}")
+    cond = cmp_formats[code[pc][0]].format(left[0], right[0])
+    last = code[target - 1]
+    if target - 1 > pc and last[0] == GOTO and last[1] == left[1]:  # the loop jumps back to the condition
+        lines.append(f"{indent}while {cond}:")
+        translate_range(code, pc + 1, target - 1, var_names, lines, indent + "    ")
+        return target
+    lines.append(f"{indent}if {cond}:")
+    if target - 1 > pc and last[0] == GOTO and target <= last[1] <= end:  # the if block skips the else block
+        translate_range(code, pc + 1, target - 1, var_names, lines, indent + "    ")
+        lines.append(f"{indent}else:")
+        translate_range(code, target, last[1], var_names, lines, indent + "    ")
+        return last[1]
+    translate_range(code, pc + 1, target, var_names, lines, indent + "    ")
+    return target
+
+
+# Returns the source of a python function with the name run that executes the linked code
+# The function gets the print function of the output sink (emit) and the initial values of the variables by slot
+# and returns the values at the end as list
+def translate_code(code, var_names):
+    names = [py_name(var_names, slot) for slot in range(len(var_names))]
+    lines = [f"def run({', '.join(['emit'] + names)}):"]
+    translate_range(code, 0, len(code), var_names, lines, "    ")
+    lines.append(f"    return [{', '.join(names)}]")
+    return "\n".join(lines) + "\n"
+
+
+# Returns the compiled function of the code, raises a ValueError if the code can't be translated
+def compile_code(code, var_names):
+    namespace = {}
+    try:
+        source = translate_code(code, var_names)
+        exec(compile(source, "<mmjava>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError) as e:  # too deeply nested for the python compiler
+        raise ValueError(f"Python can't compile the program: {e}")
+    return namespace["run"]
+
+
+# Executes the program as compiled python function and returns the values of the variables at the end
+# The function is compiled on the first run, code that can't be compiled is executed by the stack VM instead
+def run_native(program, values=None, output=None):
+    if program.native is None:
+        try:
+            program.native = compile_code(program.get_code(), program.get_var_names())
+        except ValueError:
+            program.native = False
+    if program.native is False:
+        return program.run(values, output=output)
+    if output is None:
+        output = OUTPUT()
+    try:
+        return program.variable_values(program.native(output.print, *program.initial_variables(values)))
+    finally:
+        output.flush()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from Interpreter import FRAME
+
+# Cooperative scheduler for running many programs at once in one thread under asyncio
+# Every program runs as a task on the stack VM in slices of slice_size instructions (see FRAME.execute_steps), after
+# every slice the task yields to the event loop. The event loop resumes the waiting tasks in the order in which they
+# yielded, so all tasks get their slices round robin and a program with an endless loop only gets its share of the time
+# A task ends when its program ends, when it raises an error, when it has executed more than budget instructions or
+# when it runs longer than timeout seconds (the time it waits for the other tasks included)
+
+
+# The state and the result of one program run by the scheduler
+# status is "running", "ok", "budget" (the budget was used up), "timeout" or the name of the error of the program
+class TASK:
+    def __init__(self, name, frame, budget=None, timeout=None):
+        self.name = name
+        self.frame = frame
+        self.budget = budget  # maximal number of executed instructions, None for no limit
+        self.timeout = timeout  # maximal run time in seconds, None for no limit
+        self.status = "running"
+        self.error = ""
+        self.executed = 0  # executed instructions
+        self.seconds = 0
+        self.values = None  # the values of the variables at the end, only set if the status is "ok"
+
+    def get_status(self):
+        return self.status
+
+    def get_values(self):
+        return self.values
+
+
+class SCHEDULER:
+    # budget and timeout are the limits of the tasks that don't have their own
+    def __init__(self, slice_size=1000, budget=None, timeout=None):
+        self.slice_size = slice_size
+        self.budget = budget
+        self.timeout = timeout
+        self.tasks = set()  # the running tasks
+
+    # Runs the program as a task and returns the TASK when it has ended, the arguments are the ones of PROGRAM.run
+    # The program runs concurrently with all other tasks of the scheduler
+    async def run(self, program, values=None, code=None, output=None, name=None, budget=None, timeout=None):
+        task = TASK(name, FRAME(program, values, code, output), self.budget if budget is None else budget,
+                    self.timeout if timeout is None else timeout)
+        self.tasks.add(task)
+        start = time.perf_counter()
+        try:
+            await self.run_task(task, start)
+        finally:
+            self.tasks.discard(task)
+            task.seconds = time.perf_counter() - start
+            task.frame.output.flush()
+        return task
+
+    async def run_task(self, task, start):
+        frame = task.frame
+        while True:
+            steps = self.slice_size
+            if task.budget is not None:
+                steps = min(steps, task.budget - task.executed + 1)  # one more, to see if the budget is exceeded
+            try:
+                task.executed += frame.execute_steps(steps)
+            except Exception as e:
+                (task.status, task.error) = (type(e).__name__, str(e))
+                return
+            if task.budget is not None and task.executed > task.budget:
+                (task.status, task.error) = ("budget", f"More than {task.budget} instructions executed")
+                return
+            if frame.finished():
+                (task.status, task.values) = ("ok", frame.get_values())
+                return
+            if task.timeout is not None and time.perf_counter() - start > task.timeout:
+                (task.status, task.error) = ("timeout", f"Not finished after {task.timeout} seconds")
+                return
+            await asyncio.sleep(0)  # let the other tasks run
+
+    # Runs all programs concurrently and returns their TASKs when all have ended, names are the names of the tasks
+    async def run_all(self, programs, names=None, outputs=None):
+        names = names if names is not None else [None] * len(programs)
+        outputs = outputs if outputs is not None else [None] * len(programs)
+        return await asyncio.gather(*(self.run(program, output=output, name=name)
+                                      for (program, name, output) in zip(programs, names, outputs)))
+
+
+# Runs the programs concurrently in a new event loop and returns their TASKs, the arguments are the ones of SCHEDULER
+def run_concurrently(programs, slice_size=1000, budget=None, timeout=None, names=None, outputs=None):
+    return asyncio.run(SCHEDULER(slice_size, budget, timeout).run_all(programs, names, outputs))
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from Parser import get_parsing_table
+from Parser import parse_error
+from ProgramCache import compile_program
+from ProgramCache import serialize_program
+from ProgramCache import deserialize_program
+from ProgramCache import source_hash
+from Engines import engines
+from Output import MEMORY_OUTPUT
+from Optimizer import get_optimized_code
+from Scheduler import SCHEDULER
+
+# Server mode: a long running process that compiles and executes programs for clients on the same machine
+# The server listens on a local TCP port or a Unix socket. Every request is one line of json and is answered with one
+# line of json, a client can send several requests on one connection without waiting for the answers, the answers
+# carry the id of their request and come in the order in which the runs end
+# Request: {"id": any, "source": program, "values": {name: value}, "engine": name, "optimized": bool (optimized syntax
+# tree), "budget": instructions, "timeout": seconds}, only source is required. {"id": any, "stats": true} returns the
+# counters of the server
+# Answer: {"id", "status" ("ok", "budget", "timeout" or the name of the error), "error", "output", "values",
+# "cached" (the compiled program was in the cache), "compile_seconds", "run_seconds"}, the answer to a program with a
+# syntax error also has the "span" of the unexpected token (see Lexer.Token.get_span)
+# The programs are executed on a process pool, so the runs of several clients are parallel and an endless loop blocks
+# only one worker. The compiled programs are kept in an LRU cache by the hash of the source: a worker compiles a
+# program that is not in the cache and returns it serialized (see ProgramCache.py), the next request with the same
+# source sends the serialized program to the worker, which only has to deserialize it. Every worker also keeps the
+# programs it has deserialized last, so the code of the optimized, native and jit engines is built only once per worker
+# budget and timeout are the limits of a run, with a limit the stack and optimized engines run in slices on the scheduler
+# (see Scheduler.py) and stop at the limits. The other engines don't count their instructions, a request with a budget
+# for them is rejected (the budget of the server only applies to the stack and optimized engines), their timeout is
+# enforced with a timer signal in the worker, so an endless loop doesn't block the worker
+
+default_cache_size = 256  # compiled programs in the cache of the server
+scheduled_engines = ("stack", "optimized")  # the engines that run on the scheduler and count their instructions
+worker_cache_size = 32  # deserialized programs in the cache of every worker
+
+
+# Cache with a maximal number of entries, the least recently used entry is evicted first
+class LRU_CACHE:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the value of key or None if key is not in the cache
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def get_stats(self):
+        return {"entries": len(self.entries), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+worker_programs = LRU_CACHE(worker_cache_size)
+
+
+# Raises a TimeoutError in the run of a worker when the timer of its timeout expires
+def raise_timeout(signum, frame):
+    raise TimeoutError
+
+
+# Builds the parsing table once when a worker starts
+def init_worker():
+    get_parsing_table()
+    signal.signal(signal.SIGALRM, raise_timeout)
+
+
+# Returns the program of the source and the serialized program if it had to be compiled, runs in a worker process
+# data is the serialized program from the cache of the server or None, key is the cache key of the source
+def worker_program(key, source, data, optimized):
+    program = worker_programs.get(key)
+    if program is not None:
+        return program, None
+    if data is not None:
+        program = deserialize_program(data, source)
+    if program is None:
+        program = compile_program(source, optimized)
+        data = serialize_program(program, source)
+    else:
+        data = None
+    worker_programs.put(key, program)
+    return program, data
+
+
+# Compiles and executes a program, runs in a worker process
+# Returns the answer without the id and the serialized program if it was compiled (None otherwise)
+def run_request(key, source, data, values, engine_name, optimized, budget, timeout):
+    output = MEMORY_OUTPUT()
+    answer = {"status": "ok", "error": "", "output": "", "values": None, "cached": data is not None,
+              "compile_seconds": 0, "run_seconds": 0}
+    start = time.perf_counter()
+    try:
+        (program, data) = worker_program(key, source, data, optimized)
+    except Exception as e:
+        (answer["status"], answer["error"]) = (type(e).__name__, str(e))
+        if isinstance(e, SyntaxError) and parse_error.token is not None:
+            answer["span"] = parse_error.token.get_span()  # position of the syntax error in the source
+        answer["compile_seconds"] = time.perf_counter() - start
+        return answer, None
+    answer["compile_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    try:
+        if engine_name in scheduled_engines and (budget is not None or timeout is not None):
+            code = get_optimized_code(program) if engine_name == "optimized" else None
+            scheduler = SCHEDULER(budget=budget, timeout=timeout)
+            task = asyncio.run(scheduler.run(program, values, code, output))
+            (answer["status"], answer["error"], answer["values"]) = (task.status, task.error, task.values)
+        elif timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, max(timeout, 1e-6))  # 0 would disable the timer
+            try:
+                answer["values"] = engines[engine_name](program, values, output)
+            except TimeoutError:
+                (answer["status"], answer["error"]) = ("timeout", f"Not finished after {timeout} seconds")
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        else:
+            answer["values"] = engines[engine_name](program, values, output)
+    except Exception as e:
+        (answer["status"], answer["error"]) = (type(e).__name__, str(e))
+    answer["run_seconds"] = time.perf_counter() - start
+    answer["output"] = output.get_value()
+    return answer, data
+
+
+class SERVER:
+    # budget and timeout are the limits of the requests that don't have their own, None for no limit
+    def __init__(self, workers=None, cache_size=default_cache_size, budget=None, timeout=None):
+        # spawned workers, a forked worker would inherit the sockets of the open connections and keep them open
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_worker)
+        self.cache = LRU_CACHE(cache_size)
+        self.budget = budget
+        self.timeout = timeout
+        self.requests = 0
+
+    def get_stats(self):
+        return {"requests": self.requests, "cache": self.cache.get_stats()}
+
+    # Returns the answer to the request (a dict), the answer to a malformed request has the status "RequestError"
+    async def answer(self, request):
+        self.requests += 1
+        if not isinstance(request, dict):
+            return {"status": "RequestError", "error": "A request must be a json object"}
+        if request.get("stats"):
+            return {"id": request.get("id"), "status": "ok", "stats": self.get_stats()}
+        source = request.get("source")
+        engine_name = request.get("engine", "stack")
+        values = request.get("values")
+        if not isinstance(source, str):
+            return {"id": request.get("id"), "status": "RequestError", "error": "The request has no source"}
+        if engine_name not in engines:
+            return {"id": request.get("id"), "status": "RequestError", "error": f"Unknown engine '{engine_name}'"}
+        if values is not None and not (isinstance(values, dict) and
+                                       all(type(value) is int for value in values.values())):
+            return {"id": request.get("id"), "status": "RequestError", "error": "The values must be integers"}
+        budget = request.get("budget", self.budget if engine_name in scheduled_engines else None)
+        if budget is not None and engine_name not in scheduled_engines:
+            return {"id": request.get("id"), "status": "RequestError",
+                    "error": f"The engine '{engine_name}' has no instruction budget, only a timeout"}
+        optimized = bool(request.get("optimized", False))
+        key = source_hash(source) + (b"O" if optimized else b"")
+        data = self.cache.get(key)
+        (answer, compiled) = await asyncio.get_running_loop().run_in_executor(
+            self.pool, run_request, key, source, data, values, engine_name, optimized,
+            budget, request.get("timeout", self.timeout))
+        if compiled is not None:
+            self.cache.put(key, compiled)
+        answer["id"] = request.get("id")
+        return answer
+
+    async def answer_line(self, line, writer):
+        try:
+            answer = await self.answer(json.loads(line))
+        except json.JSONDecodeError as e:
+            answer = {"status": "RequestError", "error": f"Invalid json: {e}"}
+        writer.write(json.dumps(answer).encode() + b"\n")
+        await writer.drain()
+
+    # Reads the requests of a connection and answers every request as soon as its run has ended
+    async def handle_connection(self, reader, writer):
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(self.answer_line(line, writer))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    # Serves until the process is stopped, on the Unix socket path if it is given, otherwise on host:port
+    async def serve(self, host="127.0.0.1", port=8765, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path, limit=2 ** 24)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=2 ** 24)
+        address = path if path is not None else f"{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"Serving on {address}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+
+arg_parser = argparse.ArgumentParser(description="Compiles and executes programs for local clients, one json request "
+                                                 "per line")
+arg_parser.add_argument("--host", default="127.0.0.1", help="host of the TCP server (default: 127.0.0.1)")
+arg_parser.add_argument("--port", type=int, default=8765, help="port of the TCP server, 0 for any (default: 8765)")
+arg_parser.add_argument("--unix", metavar="PATH", help="listen on this Unix socket instead of TCP")
+arg_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes (default: all cores)")
+arg_parser.add_argument("--cache-size", type=int, default=default_cache_size,
+                        help=f"compiled programs in the cache (default: {default_cache_size})")
+arg_parser.add_argument("--budget", type=int, default=None, help="default instruction budget of a run of the stack and optimized "
+                                                                    "engines")
+arg_parser.add_argument("--timeout", type=float, default=None, help="default timeout of a run in seconds")
+
+
+if __name__ == '__main__':
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(SERVER(args.jobs, args.cache_size, args.budget, args.timeout).serve(args.host, args.port,
+                                                                                          args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -1,14 +1,23 @@
 def bind_children(parent, child_list):
     for child in child_list:
-        child.set_parent(parent)
         parent.add_child(child)
 
 
+# Leaves share this empty tuple as children, a list is only created when the first child is added
+no_children = ()
+
+
+# A node of the syntax tree, __slots__ keeps the nodes small as there is one node per symbol of the program
+# The nodes have no parent pointer, so the tree has no reference cycles and is freed by reference counting
+# span is the position (line, col, end line, end col) of the node in the program, the end is exclusive. The parser sets
+# it for the inner nodes, the leaves take the position of their token
 class AST_NODE:
-    def __init__(self, token):
+    __slots__ = ("token", "children", "span")
+
+    def __init__(self, token, children=no_children, span=None):
         self.token = token
-        self.children = []
-        self.parent = None
+        self.children = children
+        self.span = span
 
     def to_string(self):
         return self.token.to_string()
@@ -25,13 +34,17 @@ class AST_NODE:
     def get_value(self):
         return self.token.get_value()
 
-    def set_parent(self, p):
-        self.parent = p
+    # Returns the span of the node, None for nodes that were not created by the parser
+    def get_span(self):
+        return self.span if self.span is not None else self.token.get_span()
 
-    def get_parent(self):
-        return self.parent
+    def get_line(self):
+        span = self.get_span()
+        return span[0] if span is not None else None
 
     def add_child(self, c):
+        if self.children is no_children:
+            self.children = []
         self.children.append(c)
 
     def replace_child(self, old, new):
@@ -0,0 +1,229 @@
+import itertools
+
+from Interpreter import *
+from Output import OUTPUT
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, without it the lanes are executed one after another on the stack VM
+    np = None
+
+# Vectorized execution of one program over many initial values of its variables (lanes)
+# Every variable and every entry of the operand stack is a numpy int64 array with one element per lane. The VM executes
+# the instruction at the lowest program counter of all running lanes for all lanes that are at this address, so the
+# lanes that take a branch wait until the others reach them again, and a loop runs until its last lane has left it
+# The depth of the operand stack is the same at every address for all lanes (see Interpreter.stack_depths), so the
+# stack is an array of depth x lanes
+# The variables of the VM are int64, the program has arbitrary large integers: a lane leaves the VM (escapes) when a
+# result could get too large for an int64, when it divides by 0 and when a division isn't exact in float64. The escaped
+# lanes are executed again from the start on the stack VM, so the results are exactly those of the stack VM
+# The output of the print instructions is written lane by lane, as if the lanes had been run one after another
+
+max_vector_value = 2 ** 62  # larger results escape, so the int64 arithmetic never overflows
+max_exact_float = 2 ** 53  # operands of a division above this are not exact in float64
+
+
+# Returns the initial values of the lanes as the cartesian product of the ranges: name -> list of values
+def grid_inputs(ranges):
+    names = list(ranges)
+    columns = {name: [] for name in names}
+    for values in itertools.product(*(ranges[name] for name in names)):
+        for (name, value) in zip(names, values):
+            columns[name].append(value)
+    return columns
+
+
+# Returns the number of lanes of inputs (name -> values of the lanes), raises a ValueError if it differs between names
+def lane_count(inputs):
+    if not inputs:
+        raise ValueError("The lanes need initial values for at least one variable")
+    counts = {len(values) for values in inputs.values()}
+    if len(counts) != 1:
+        raise ValueError("All variables need the same number of initial values")
+    return counts.pop()
+
+
+def lane_values(inputs, lane):
+    return {name: int(values[lane]) for (name, values) in inputs.items()}
+
+
+# Executes the lanes one after another on the stack VM, returns the values and the errors like run_vectorized
+def run_lanes(program, inputs, code=None, output=None, lanes=None):
+    values = {name: [] for name in program.get_var_names()}
+    errors = {}
+    for lane in range(lane_count(inputs)) if lanes is None else lanes:
+        try:
+            result = program.run(lane_values(inputs, lane), code, output)
+        except Exception as e:
+            errors[lane] = e
+            result = dict.fromkeys(program.get_var_names(), 0)
+        for (name, value) in result.items():
+            values[name].append(value)
+    return values, errors
+
+
+# Executes the code on the lanes, variables is the array vars x lanes, escaped the lanes that are not executed
+# Returns the escaped lanes as bool array and the print events as list of pairs (lanes, values)
+def execute_lanes(code, variables, depths, escaped):
+    n = variables.shape[1]
+    end = len(code)
+    stack = np.zeros((max(depth for depth in depths if depth is not None) + 1, n), dtype=np.int64)
+    pcs = np.where(escaped, end, 0)
+    all_lanes = np.arange(n)
+    prints = []
+    while True:
+        p = int(pcs.min())  # finished and escaped lanes are at end
+        if p >= end:
+            return escaped, prints
+        lanes = np.flatnonzero(pcs == p)
+        sel = slice(None) if len(lanes) == n else lanes  # a slice is faster than indexing with all lanes
+        cmd = code[p]
+        op = cmd[0]
+        d = depths[p]
+        esc = None  # the lanes that escape at this instruction
+        target = None  # the lanes that jump, None for no jump
+        if op == ILOAD:
+            stack[d, sel] = variables[cmd[1], sel]
+        elif op == ICONST:
+            stack[d, sel] = cmd[1]
+        elif op == ISTORE:
+            variables[cmd[1], sel] = stack[d - 1, sel]
+        elif op == IADD or op == ISUB or op == IMUL:
+            a = stack[d - 2, sel]
+            b = stack[d - 1, sel]
+            (result, esc) = vector_binop(op, a, b)
+            stack[d - 2, sel] = result
+        elif op == IDIV:
+            a = stack[d - 2, sel]
+            b = stack[d - 1, sel]
+            esc = (b == 0) | (np.abs(a) > max_exact_float) | (np.abs(b) > max_exact_float)
+            stack[d - 2, sel] = np.trunc(a / np.where(b == 0, 1, b)).astype(np.int64)
+        elif op == PRINT:
+            prints.append((all_lanes[sel], stack[d - 1, sel].copy()))
+        elif op == GOTO:
+            target = True
+        elif op == ICMPE:
+            target = stack[d - 1, sel] != stack[d - 2, sel]
+        elif op == ICMPGE:
+            target = stack[d - 1, sel] > stack[d - 2, sel]
+        elif op == IINC:
+            (variables[cmd[3], sel], esc) = vector_binop(IADD, variables[cmd[1], sel], cmd[2])
+        elif op == IMOV:
+            variables[cmd[2], sel] = variables[cmd[1], sel]
+        elif op == ISET:
+            variables[cmd[2], sel] = cmd[1]
+        elif op == IADD_VV or op == ISUB_VV or op == IMUL_VV:
+            (variables[cmd[3], sel], esc) = vector_binop(fused_binops[op], variables[cmd[1], sel],
+                                                         variables[cmd[2], sel])
+        elif op == PRINT_V:
+            prints.append((all_lanes[sel], variables[cmd[1], sel].copy()))
+        elif op == ICMPE_VV:
+            target = variables[cmd[1], sel] != variables[cmd[2], sel]
+        elif op == ICMPE_VC:
+            target = variables[cmd[1], sel] != cmd[2]
+        elif op == ICMPE_CV:
+            target = cmd[1] != variables[cmd[2], sel]
+        elif op == ICMPGE_VV:
+            target = variables[cmd[1], sel] < variables[cmd[2], sel]
+        elif op == ICMPGE_VC:
+            target = variables[cmd[1], sel] < cmd[2]
+        elif op == ICMPGE_CV:
+            target = cmd[1] < variables[cmd[2], sel]
+        if target is None:
+            pcs[sel] = p + 1
+        elif target is True:
+            pcs[sel] = cmd[1]
+        else:
+            pcs[sel] = np.where(target, cmd[-1], p + 1)
+        if esc is not None and esc.any():
+            escaped_lanes = all_lanes[sel][esc]
+            escaped[escaped_lanes] = True
+            pcs[escaped_lanes] = end
+
+
+fused_binops = {IADD_VV: IADD, ISUB_VV: ISUB, IMUL_VV: IMUL}
+
+
+# Returns the result of the binary operation on the lanes and the lanes whose result might not fit into an int64
+def vector_binop(op, a, b):
+    a_float = np.asarray(a, dtype=np.float64)
+    if op == IADD:
+        return a + b, np.abs(a_float + b) >= max_vector_value
+    if op == ISUB:
+        return a - b, np.abs(a_float - b) >= max_vector_value
+    return a * b, np.abs(a_float * b) >= max_vector_value
+
+
+# Writes the output of the lanes in the order of the lanes and executes the escaped lanes on the stack VM in between
+# Returns the values and errors of the escaped lanes: lane -> values, lane -> error
+def merge_lanes(program, inputs, code, output, escaped, prints):
+    results = {}
+    errors = {}
+    if prints:
+        event_lanes = np.concatenate([lanes for (lanes, _) in prints])
+        order = np.argsort(event_lanes, kind="stable")  # the events of a lane stay in the order of the execution
+        event_lanes = event_lanes[order]
+        event_values = np.concatenate([values for (_, values) in prints])[order]
+    else:
+        event_lanes = np.zeros(0, dtype=np.int64)
+        event_values = np.zeros(0, dtype=np.int64)
+    pos = 0
+    for lane in np.flatnonzero(escaped).tolist():
+        for value in event_values[pos:np.searchsorted(event_lanes, lane)].tolist():
+            output.print(value)
+        pos = np.searchsorted(event_lanes, lane, side="right")  # the prints of the escaped lane are dropped
+        try:
+            results[lane] = program.run(lane_values(inputs, lane), code, output)
+        except Exception as e:
+            errors[lane] = e
+            results[lane] = dict.fromkeys(program.get_var_names(), 0)
+    for value in event_values[pos:].tolist():
+        output.print(value)
+    return results, errors
+
+
+# Executes the program once for every lane of inputs and returns the values of the variables of all lanes and the
+# errors: name -> values of the lanes, lane -> error (the values of a lane with an error are 0)
+# inputs maps names to the initial values of the lanes, every name has the same number of values, the other variables
+# are 0. code is the linked code by default, output is the sink of the print instruction
+# With numpy the values are int64 arrays (object arrays if a result doesn't fit), without numpy lists and the lanes
+# are executed one after another. Programs whose stack depth isn't static are executed lane by lane as well
+def run_vectorized(program, inputs, code=None, output=None):
+    if output is None:
+        output = OUTPUT()
+    code = program.get_code() if code is None else code
+    n = lane_count(inputs)
+    for name in inputs:
+        if name not in program.slots:
+            raise NameError(f"Variable '{name}' is not declared")
+    if np is None or any(k == "c" and abs(arg) >= max_vector_value
+                         for instr in code for (k, arg) in zip(operand_kinds[instr[0]], instr[1:])):
+        return run_lanes(program, inputs, code, output)
+    try:
+        depths = stack_depths(code)
+    except ValueError:
+        return run_lanes(program, inputs, code, output)
+    variables = np.zeros((len(program.get_var_names()), n), dtype=np.int64)
+    escaped = np.zeros(n, dtype=bool)  # lanes with too large initial values only run on the stack VM
+    for (name, values) in inputs.items():
+        column = np.array([int(value) for value in values], dtype=object)
+        large = np.array([abs(value) >= max_vector_value for value in column.tolist()], dtype=bool)
+        column[large] = 0
+        variables[program.slots[name]] = column.astype(np.int64)
+        escaped |= large
+    try:
+        (escaped, prints) = execute_lanes(code, variables, depths, escaped)
+        (results, errors) = merge_lanes(program, inputs, code, output, escaped, prints)
+    finally:
+        output.flush()
+    values = {}
+    for (slot, name) in enumerate(program.get_var_names()):
+        column = variables[slot]
+        if results:
+            column = column.astype(object)
+            for (lane, result) in results.items():
+                column[lane] = result[name]
+            if all(abs(value) < 2 ** 63 for value in column[list(results)].tolist()):
+                column = column.astype(np.int64)
+        values[name] = column
+    return values, errors